@@ -1,8 +1,14 @@
+import asyncio
+import importlib.util
 import anthropic
-from typing import List, Optional, Dict, Any
+import httpx
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
-import json
+import logging
+import orjson
+
+logger = logging.getLogger(__name__)
 
 
 class TerminationReason(Enum):
@@ -29,14 +35,22 @@ class ToolCallState:
         self.tools_executed.append(f"Round {self.current_round}: {tool_name}")
 
 
+class ResponseGenerationError(Exception):
+    """Raised when a streamed response cannot be completed"""
+
+
 class AIGenerator:
     """Handles interactions with Anthropic's Claude API for generating responses"""
     
+    # Beta flag that trims tool_use output tokens on Claude 3.7 Sonnet
+    TOKEN_EFFICIENT_TOOLS_BETA = "token-efficient-tools-2025-02-19"
+    
     # Static system prompt to avoid rebuilding on each call
     SYSTEM_PROMPT = """ You are an AI assistant specialized in course materials and educational content with access to comprehensive tools for course information.
 
 Tool Usage Guidelines:
 - **Sequential Tool Calling**: You can make up to 2 rounds of tool calls to gather comprehensive information
+- **Parallel Tool Calls**: When you need several independent lookups (e.g. a course outline and a content search), request all of them in the same turn rather than spreading them across rounds
 - **Content Search Tool**: Use to search INSIDE lessons for specific topics, concepts, explanations, or detailed content
 - **Course Outline Tool**: Use to get lesson lists, course structure, titles, or to understand WHAT exists in a course
 - **Strategy**: Consider what information you need upfront and plan your tool usage accordingly
@@ -56,7 +70,7 @@ Response Protocol:
 - **Course content questions**: Use content search tool first, then additional tools if needed
 - **Course outline/structure questions**: Use outline tool first, then content search if needed  
 - **Complex queries**: May require multiple tool calls across rounds to fully address
-- **Multi-step queries**: Use first round to gather initial information, second round to refine or get additional details
+- **Multi-step queries**: Use a second round only when a lookup depends on results from the first (e.g. searching for a lesson title found in an outline)
 - **No meta-commentary**:
  - Provide direct answers only — no reasoning process, tool explanations, or question-type analysis
  - Do not mention "based on the search results" or "using the tool"
@@ -74,21 +88,37 @@ All responses must be:
 Provide only the direct answer to what was asked.
 """
     
-    def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    def __init__(self, api_key: str, model: str, max_concurrency: int = 10):
+        # One pooled keep-alive connection set shared by every request; HTTP/2
+        # multiplexes concurrent calls when the optional h2 package is installed
+        self._http = httpx.AsyncClient(
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(max_keepalive_connections=100, max_connections=200),
+            timeout=httpx.Timeout(60.0, connect=5.0)
+        )
+        self.client = anthropic.AsyncAnthropic(api_key=api_key, http_client=self._http)
         self.model = model
         
+        # Cap in-flight API calls so request bursts queue here instead of
+        # triggering rate-limit errors and retry storms
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        
         # Pre-build base API parameters
         self.base_params = {
             "model": self.model,
             "temperature": 0,
             "max_tokens": 800
         }
+        
+        # Claude 3.7 Sonnet needs the beta header for token-efficient tool use
+        # (later models have it built in)
+        if self.model.startswith("claude-3-7-sonnet"):
+            self.base_params["extra_headers"] = {"anthropic-beta": self.TOKEN_EFFICIENT_TOOLS_BETA}
     
-    def generate_response(self, query: str,
-                         conversation_history: Optional[str] = None,
-                         tools: Optional[List] = None,
-                         tool_manager=None) -> str:
+    async def generate_response(self, query: str,
+                                conversation_history: Optional[str] = None,
+                                tools: Optional[List] = None,
+                                tool_manager=None) -> str:
         """
         Generate AI response with support for up to 2 sequential tool calling rounds.
         
@@ -102,41 +132,123 @@ Provide only the direct answer to what was asked.
             Generated response as string
         """
         
+        state, system_content, tools = self._prepare_request(query, conversation_history, tools)
+        
+        answer = await self._run_tool_rounds(state, system_content, tools, tool_manager)
+        if answer is not None:
+            return answer
+        
+        # Max rounds reached, make final call without tools
+        try:
+            final_response = await self._create_message(**self._final_params(state, system_content))
+            return final_response.content[0].text
+        except Exception as e:
+            return f"Error generating final response: {str(e)}"
+    
+    async def stream_response(self, query: str,
+                              conversation_history: Optional[str] = None,
+                              tools: Optional[List] = None,
+                              tool_manager=None) -> AsyncIterator[str]:
+        """
+        Generate AI response as a stream of text chunks.
+        
+        Every round is streamed, so an answer given without tools arrives as it
+        is generated. When a round stops for tool_use its tool calls are taken
+        from the buffered final message and the next round streams after them.
+        
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+            
+        Yields:
+            Text chunks of the generated response
+            
+        Raises:
+            ResponseGenerationError: If an API call or tool execution fails;
+                chunks already yielded are an incomplete answer
+        """
+        state, system_content, tools = self._prepare_request(query, conversation_history, tools)
+        
+        while True:
+            if not tools:
+                params = {**self.base_params, "messages": state.messages, "system": system_content}
+                error_prefix = "Error generating response"
+            elif not state.is_complete():
+                state.current_round += 1
+                params = self._round_params(state, system_content, tools)
+                error_prefix = "Error generating response"
+            else:
+                params = self._final_params(state, system_content)
+                error_prefix = "Error generating final response"
+            
+            streamed_text = False
+            try:
+                async with self._semaphore:
+                    async with self.client.messages.stream(**params) as stream:
+                        async for text in stream.text_stream:
+                            streamed_text = True
+                            yield text
+                        response = await stream.get_final_message()
+            except Exception as e:
+                raise ResponseGenerationError(f"{error_prefix}: {str(e)}") from e
+            
+            if response.stop_reason != "tool_use" or not tool_manager or "tools" not in params:
+                return
+            
+            # Keep text sent before the tool calls apart from the next round's text
+            if streamed_text:
+                yield "\n\n"
+            
+            state.messages.append({"role": "assistant", "content": response.content})
+            tool_error = await self._execute_round_tools(response, state, tool_manager)
+            if tool_error:
+                raise ResponseGenerationError(f"Unable to complete search: {tool_error}")
+    
+    def _prepare_request(self, query: str, conversation_history: Optional[str],
+                         tools: Optional[List]) -> Tuple[ToolCallState, List[Dict[str, Any]], Optional[List]]:
+        """Build the initial tool call state, cacheable system blocks and tool list"""
         # Initialize tool call state
         state = ToolCallState(
             messages=[{"role": "user", "content": query}],
             max_rounds=2
         )
         
-        # Build base system content
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history 
-            else self.SYSTEM_PROMPT
-        )
+        # Build base system blocks - the static prompt is marked cacheable so
+        # every round and request reuses the same cached prefix
+        system_content = [
+            {"type": "text", "text": self.SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}
+        ]
+        if conversation_history:
+            system_content.append({
+                "type": "text",
+                "text": f"Previous conversation:\n{conversation_history}"
+            })
         
-        # Sequential tool calling loop
+        # Mark the last tool definition cacheable without mutating the caller's list
+        if tools:
+            tools = [*tools[:-1], {**tools[-1], "cache_control": {"type": "ephemeral"}}]
+        
+        return state, system_content, tools
+    
+    async def _run_tool_rounds(self, state: ToolCallState, system_content: List[Dict[str, Any]],
+                               tools: Optional[List], tool_manager) -> Optional[str]:
+        """
+        Run the sequential tool calling rounds.
+        
+        Returns:
+            The answer (or an error message) if one was produced, None if the
+            rounds were exhausted and a final call without tools is needed
+        """
         while not state.is_complete():
             state.current_round += 1
             
-            # Get round-specific system prompt
-            round_system_content = self._get_round_system_prompt(system_content, state.current_round)
-            
-            # Prepare API call parameters
-            api_params = {
-                **self.base_params,
-                "messages": state.messages.copy(),
-                "system": round_system_content
-            }
-            
-            # Add tools if available and not at max rounds
-            if tools and state.current_round <= state.max_rounds:
-                api_params["tools"] = tools
-                api_params["tool_choice"] = {"type": "auto"}
+            api_params = self._round_params(state, system_content, tools)
             
             try:
                 # Get response from Claude
-                response = self.client.messages.create(**api_params)
+                response = await self._create_message(**api_params)
                 
                 # Add assistant response to messages
                 state.messages.append({"role": "assistant", "content": response.content})
@@ -144,7 +256,7 @@ Provide only the direct answer to what was asked.
                 # Check if tools were used
                 if response.stop_reason == "tool_use" and tool_manager:
                     # Execute tools and add results
-                    tool_error = self._execute_round_tools(response, state, tool_manager)
+                    tool_error = await self._execute_round_tools(response, state, tool_manager)
                     
                     # If tool execution failed, terminate
                     if tool_error:
@@ -158,42 +270,74 @@ Provide only the direct answer to what was asked.
                 # API error, return what we have or error message
                 return f"Error generating response: {str(e)}"
         
-        # Max rounds reached, make final call without tools
-        final_system_content = f"{system_content}\n\nTool calling rounds complete. Provide your final answer based on all available information."
+        return None
+    
+    def _round_params(self, state: ToolCallState, system_content: List[Dict[str, Any]],
+                      tools: Optional[List]) -> Dict[str, Any]:
+        """Build parameters for the current tool calling round"""
+        # Get round-specific system prompt
+        round_system_content = self._get_round_system_prompt(system_content, state.current_round)
         
-        final_params = {
+        # Prepare API call parameters (the SDK serializes messages without mutating them)
+        api_params = {
             **self.base_params,
             "messages": state.messages,
-            "system": final_system_content
+            "system": round_system_content
         }
         
-        try:
-            final_response = self.client.messages.create(**final_params)
-            return final_response.content[0].text
-        except Exception as e:
-            return f"Error generating final response: {str(e)}"
+        # Add tools if available and not at max rounds
+        if tools and state.current_round <= state.max_rounds:
+            api_params["tools"] = tools
+            api_params["tool_choice"] = {"type": "auto"}
+        
+        return api_params
+    
+    def _final_params(self, state: ToolCallState, system_content: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build parameters for the final call without tools once rounds are complete"""
+        final_system_content = [
+            *system_content,
+            {"type": "text", "text": "Tool calling rounds complete. Provide your final answer based on all available information."}
+        ]
+        
+        return {
+            **self.base_params,
+            "messages": state.messages,
+            "system": final_system_content
+        }
+    
+    async def _create_message(self, **params):
+        """Send a messages request while holding a concurrency slot"""
+        async with self._semaphore:
+            return await self.client.messages.create(**params)
     
-    def _get_round_system_prompt(self, base_system_content: str, round_number: int) -> str:
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections"""
+        await self._http.aclose()
+    
+    def _get_round_system_prompt(self, base_system_content: List[Dict[str, Any]], round_number: int) -> List[Dict[str, Any]]:
         """
         Generate round-specific system prompt with guidance.
         
+        The guidance goes in its own uncached block after the base blocks so the
+        cached prefix stays identical across rounds.
+        
         Args:
-            base_system_content: Base system prompt content
+            base_system_content: Base system prompt blocks
             round_number: Current round (1 or 2)
             
         Returns:
-            System prompt with round-specific guidance
+            System prompt blocks with round-specific guidance
         """
         if round_number == 1:
-            round_guidance = "\nThis is your first opportunity to use tools. Consider what information you need to fully answer the user's question and gather initial data."
+            round_guidance = "This is your first opportunity to use tools. Consider what information you need to fully answer the user's question and gather initial data."
         elif round_number == 2:
-            round_guidance = "\nThis is your second and final opportunity to use tools. Based on previous results, determine if additional information is needed to complete your answer."
+            round_guidance = "This is your second and final opportunity to use tools. Based on previous results, determine if additional information is needed to complete your answer."
         else:
-            round_guidance = "\nTool calling rounds are complete. Provide your final answer based on all available information."
+            round_guidance = "Tool calling rounds are complete. Provide your final answer based on all available information."
             
-        return f"{base_system_content}{round_guidance}"
+        return [*base_system_content, {"type": "text", "text": round_guidance}]
     
-    def _execute_round_tools(self, response, state: ToolCallState, tool_manager) -> Optional[str]:
+    async def _execute_round_tools(self, response, state: ToolCallState, tool_manager) -> Optional[str]:
         """
         Execute all tool calls from current round and add results to state.
         
@@ -205,52 +349,60 @@ Provide only the direct answer to what was asked.
         Returns:
             Error message if tool execution fails, None if successful
         """
+        tool_use_blocks = [block for block in response.content if block.type == "tool_use"]
+        
+        # Log tool call information only when debug output is enabled
+        if logger.isEnabledFor(logging.DEBUG):
+            for content_block in tool_use_blocks:
+                logger.debug(
+                    "round=%d tool call name=%s input=%s",
+                    state.current_round, content_block.name, orjson.dumps(content_block.input).decode()
+                )
+        
+        # Run independent tool calls from the same round concurrently
+        results = await asyncio.gather(
+            *(self._execute_tool_block(block, tool_manager) for block in tool_use_blocks),
+            return_exceptions=True
+        )
+        
         tool_results = []
         
-        for content_block in response.content:
-            if content_block.type == "tool_use":
-                # Print tool call information to terminal
-                print(f"\n🔧 [Round {state.current_round}] Tool Call:")
-                print(f"   Tool: {content_block.name}")
-                print(f"   Input: {json.dumps(content_block.input, indent=2)}")
+        for content_block, tool_result in zip(tool_use_blocks, results):
+            if isinstance(tool_result, Exception):
+                logger.warning("tool %s failed: %s", content_block.name, tool_result)
                 
-                try:
-                    # Execute the tool
-                    tool_result = tool_manager.execute_tool(
-                        content_block.name, 
-                        **content_block.input
-                    )
-                    
-                    # Print successful result (truncated if too long)
-                    result_preview = tool_result[:200] + "..." if len(tool_result) > 200 else tool_result
-                    print(f"   ✅ Result: {result_preview}")
-                    
-                    # Track tool execution
-                    state.add_tool_execution(content_block.name)
-                    
-                    # Add result
-                    tool_results.append({
-                        "type": "tool_result",
-                        "tool_use_id": content_block.id,
-                        "content": tool_result
-                    })
-                    
-                except Exception as e:
-                    # Print error information
-                    print(f"   ❌ Error: {str(e)}")
-                    
-                    # Tool execution failed
-                    error_msg = f"Tool {content_block.name} failed: {str(e)}"
-                    tool_results.append({
-                        "type": "tool_result",
-                        "tool_use_id": content_block.id,
-                        "content": error_msg,
-                        "is_error": True
-                    })
-                    return error_msg
+                # Tool execution failed
+                error_msg = f"Tool {content_block.name} failed: {str(tool_result)}"
+                tool_results.append({
+                    "type": "tool_result",
+                    "tool_use_id": content_block.id,
+                    "content": error_msg,
+                    "is_error": True
+                })
+                return error_msg
+            
+            # Log successful result (truncated if too long)
+            logger.debug("tool %s result=%.200s", content_block.name, tool_result)
+            
+            # Track tool execution
+            state.add_tool_execution(content_block.name)
+            
+            # Add result
+            tool_results.append({
+                "type": "tool_result",
+                "tool_use_id": content_block.id,
+                "content": tool_result
+            })
         
         # Add tool results to state messages
         if tool_results:
             state.messages.append({"role": "user", "content": tool_results})
         
-        return None
\ No newline at end of file
+        return None
+    
+    async def _execute_tool_block(self, content_block, tool_manager) -> str:
+        """Execute a single tool_use block through the tool manager"""
+        return await tool_manager.execute_tool_async(
+            content_block.name,
+            **content_block.input
+        )
\ No newline at end of file
@@ -5,40 +5,46 @@ warnings.filterwarnings("ignore", message="resource_tracker: There appear to be.
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Union
 import os
 import time
+import json
+import logging
 
 from config import config
 from rag_system import RAGSystem
 
+logger = logging.getLogger(__name__)
+
 # Initialize FastAPI app
 app = FastAPI(title="Course Materials RAG System", root_path="")
 
-# Add request logging middleware for debugging
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    print(f"🌐 Incoming request: {request.method} {request.url}")
-    print(f"📍 Headers: {dict(request.headers)}")
-    print(f"🔗 Client: {request.client}")
-    
-    response = await call_next(request)
-    
-    process_time = time.time() - start_time
-    print(f"✅ Response: {response.status_code} (took {process_time:.3f}s)")
-    print(f"📤 Response headers: {dict(response.headers)}")
-    print("---")
+# Add request logging middleware for debugging only, so production requests skip it
+if config.DEBUG:
+    # Nothing else configures logging, so route this module's and the AI
+    # generator's debug records to stderr here
+    _debug_handler = logging.StreamHandler()
+    _debug_handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+    for _logger_name in (__name__, "ai_generator"):
+        _debug_logger = logging.getLogger(_logger_name)
+        _debug_logger.setLevel(logging.DEBUG)
+        _debug_logger.addHandler(_debug_handler)
     
-    return response
-
-# Add trusted host middleware for proxy
-app.add_middleware(
-    TrustedHostMiddleware,
-    allowed_hosts=["*"]
-)
+    @app.middleware("http")
+    async def log_requests(request: Request, call_next):
+        start_time = time.time()
+        logger.debug("request %s %s client=%s headers=%s",
+                     request.method, request.url, request.client, dict(request.headers))
+        
+        response = await call_next(request)
+        
+        process_time = time.time() - start_time
+        logger.debug("response %d took=%.3fs headers=%s",
+                     response.status_code, process_time, dict(response.headers))
+        
+        return response
 
 # Enable CORS with proper settings for proxy
 app.add_middleware(
@@ -91,7 +97,7 @@ async def query_documents(request: QueryRequest):
             session_id = rag_system.session_manager.create_session()
         
         # Process query using RAG system
-        answer, sources = rag_system.query(request.query, session_id)
+        answer, sources = await rag_system.query(request.query, session_id)
         
         return QueryResponse(
             answer=answer,
@@ -114,6 +120,26 @@ async def query_documents(request: QueryRequest):
         else:
             raise HTTPException(status_code=500, detail=error_msg)
 
+@app.post("/api/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    """Process a query and stream the response as server-sent events"""
+    # Create session if not provided
+    session_id = request.session_id
+    if not session_id:
+        session_id = rag_system.session_manager.create_session()
+    
+    async def event_stream():
+        try:
+            async for event in rag_system.query_stream(request.query, session_id):
+                if event["type"] == "done":
+                    event = {**event, "session_id": session_id}
+                yield f"data: {json.dumps(event)}\n\n"
+        except Exception as e:
+            # Headers are already sent, so errors are reported in-band
+            yield f"data: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @app.get("/api/courses", response_model=CourseStats)
 async def get_course_stats():
     """Get course analytics and statistics"""
@@ -160,12 +186,20 @@ async def startup_event():
         except Exception as e:
             print(f"Error loading documents: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled Anthropic API connections"""
+    await rag_system.ai_generator.aclose()
+
 # Custom static file handler with no-cache headers for development
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 import os
 from pathlib import Path
 
+FRONTEND_DIR = "../frontend"
+INDEX_CACHE_CONTROL = "public, max-age=3600, stale-while-revalidate=86400"
+
 
 class DevStaticFiles(StaticFiles):
     async def get_response(self, path: str, scope):
@@ -177,6 +211,14 @@ class DevStaticFiles(StaticFiles):
             response.headers["Expires"] = "0"
         return response
     
-    
-# Serve static files for the frontend
-app.mount("/", StaticFiles(directory="../frontend", html=True), name="static")
\ No newline at end of file
+
+@app.get("/", include_in_schema=False)
+async def serve_index():
+    """Serve the frontend entry page; assets are versioned so it can be cached briefly"""
+    headers = {"Cache-Control": "no-cache" if config.DEBUG else INDEX_CACHE_CONTROL}
+    return FileResponse(os.path.join(FRONTEND_DIR, "index.html"), headers=headers)
+
+# Serve frontend assets under /static so API routes never fall through to the file handler;
+# outside debug mode the default ETag/Last-Modified headers let browsers revalidate cheaply
+static_files_class = DevStaticFiles if config.DEBUG else StaticFiles
+app.mount("/static", static_files_class(directory=FRONTEND_DIR), name="static")
\ No newline at end of file
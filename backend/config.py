@@ -11,6 +11,7 @@ class Config:
     # Anthropic API settings
     ANTHROPIC_API_KEY: str = os.getenv("ANTHROPIC_API_KEY", "")
     ANTHROPIC_MODEL: str = "claude-sonnet-4-20250514"
+    ANTHROPIC_CONCURRENCY: int = int(os.getenv("ANTHROPIC_CONCURRENCY", "10"))  # Max in-flight API calls
     
     # Embedding model settings
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
@@ -21,6 +22,13 @@ class Config:
     MAX_RESULTS: int = 5         # Maximum search results to return
     MAX_HISTORY: int = 2         # Number of conversation messages to remember
     
+    # Response cache settings
+    RESPONSE_CACHE_THRESHOLD: float = 0.95  # Minimum cosine similarity for a cache hit
+    RESPONSE_CACHE_TTL: int = 3600          # Seconds before cached answers expire
+    
+    # Request/response and tool call debug logging (set DEBUG=1 to enable)
+    DEBUG: bool = os.getenv("DEBUG") == "1"
+    
     # Database paths
     CHROMA_PATH: str = "./chroma_db"  # ChromaDB storage location
 
@@ -1,9 +1,11 @@
-from typing import List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict, Any, AsyncIterator
+import asyncio
 import os
 from document_processor import DocumentProcessor
 from vector_store import VectorStore
-from ai_generator import AIGenerator
+from ai_generator import AIGenerator, ResponseGenerationError
 from session_manager import SessionManager
+from response_cache import SemanticResponseCache
 from search_tools import ToolManager, CourseSearchTool, CourseOutlineTool
 from models import Course, Lesson, CourseChunk
 
@@ -16,8 +18,14 @@ class RAGSystem:
         # Initialize core components
         self.document_processor = DocumentProcessor(config.CHUNK_SIZE, config.CHUNK_OVERLAP)
         self.vector_store = VectorStore(config.CHROMA_PATH, config.EMBEDDING_MODEL, config.MAX_RESULTS)
-        self.ai_generator = AIGenerator(config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL)
+        self.ai_generator = AIGenerator(config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL,
+                                        config.ANTHROPIC_CONCURRENCY)
         self.session_manager = SessionManager(config.MAX_HISTORY)
+        self.response_cache = SemanticResponseCache(
+            self.vector_store,
+            config.RESPONSE_CACHE_THRESHOLD,
+            config.RESPONSE_CACHE_TTL
+        )
         
         # Initialize search tools
         self.tool_manager = ToolManager()
@@ -46,6 +54,9 @@ class RAGSystem:
             # Add course content chunks to vector store
             self.vector_store.add_course_content(course_chunks)
             
+            # Cached answers may say this content does not exist
+            self.response_cache.clear()
+            
             return course, len(course_chunks)
         except Exception as e:
             print(f"Error processing course document {file_path}: {e}")
@@ -69,6 +80,7 @@ class RAGSystem:
         if clear_existing:
             print("Clearing existing data for fresh rebuild...")
             self.vector_store.clear_all_data()
+            self.response_cache.clear()
         
         if not os.path.exists(folder_path):
             print(f"Folder {folder_path} does not exist")
@@ -99,9 +111,13 @@ class RAGSystem:
                 except Exception as e:
                     print(f"Error processing {file_name}: {e}")
         
+        # Cached answers may say the new content does not exist
+        if total_courses and not clear_existing:
+            self.response_cache.clear()
+        
         return total_courses, total_chunks
     
-    def query(self, query: str, session_id: Optional[str] = None) -> Tuple[str, List[str]]:
+    async def query(self, query: str, session_id: Optional[str] = None) -> Tuple[str, List[str]]:
         """
         Process a user query using the RAG system with tool-based search.
         
@@ -120,19 +136,28 @@ class RAGSystem:
         if session_id:
             history = self.session_manager.get_conversation_history(session_id)
         
-        # Generate response using AI with tools
-        response = self.ai_generator.generate_response(
-            query=prompt,
-            conversation_history=history,
-            tools=self.tool_manager.get_tool_definitions(),
-            tool_manager=self.tool_manager
-        )
+        # Embed the query once for both the cache lookup and the cache store
+        query_embedding = await asyncio.to_thread(self.response_cache.embed_query, query)
         
-        # Get sources from the search tool
-        sources = self.tool_manager.get_last_sources()
-
-        # Reset sources after retrieving them
-        self.tool_manager.reset_sources()
+        # Reuse a cached answer for a similar query in the same context
+        cached = await asyncio.to_thread(self.response_cache.lookup, query, history, query_embedding)
+        if cached:
+            response, sources = cached
+        else:
+            # Tool calls for this request record their sources in their own view,
+            # so concurrent requests never read or clear each other's sources
+            request_tools = self.tool_manager.for_request()
+            
+            # Generate response using AI with tools
+            response = await self.ai_generator.generate_response(
+                query=prompt,
+                conversation_history=history,
+                tools=request_tools.get_tool_definitions(),
+                tool_manager=request_tools
+            )
+            
+            sources = request_tools.get_sources()
+            await self._cache_response(query, history, response, sources, query_embedding)
         
         # Update conversation history
         if session_id:
@@ -141,6 +166,63 @@ class RAGSystem:
         # Return response with sources from tool searches
         return response, sources
     
+    async def query_stream(self, query: str, session_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process a user query and stream the answer as it is generated.
+        
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+            
+        Yields:
+            {"type": "chunk", "text": ...} events for the answer text, followed
+            by a single {"type": "done", "sources": [...]} event, or by a single
+            {"type": "error", "detail": ...} event if generation fails partway;
+            a failed answer is neither cached nor added to the session history
+        """
+        prompt = f"""Answer this question about course materials: {query}"""
+        
+        history = None
+        if session_id:
+            history = self.session_manager.get_conversation_history(session_id)
+        
+        query_embedding = await asyncio.to_thread(self.response_cache.embed_query, query)
+        cached = await asyncio.to_thread(self.response_cache.lookup, query, history, query_embedding)
+        if cached:
+            response, sources = cached
+            yield {"type": "chunk", "text": response}
+        else:
+            request_tools = self.tool_manager.for_request()
+            chunks = []
+            try:
+                async for text in self.ai_generator.stream_response(
+                    query=prompt,
+                    conversation_history=history,
+                    tools=request_tools.get_tool_definitions(),
+                    tool_manager=request_tools
+                ):
+                    chunks.append(text)
+                    yield {"type": "chunk", "text": text}
+            except ResponseGenerationError as e:
+                yield {"type": "error", "detail": str(e)}
+                return
+            
+            response = "".join(chunks)
+            sources = request_tools.get_sources()
+            await self._cache_response(query, history, response, sources, query_embedding)
+        
+        if session_id:
+            self.session_manager.add_exchange(session_id, query, response)
+        
+        yield {"type": "done", "sources": sources}
+    
+    async def _cache_response(self, query: str, history: Optional[str], response: str, sources: List,
+                              query_embedding: Optional[List[float]] = None):
+        """Cache a generated answer with the sources of this request's tool calls"""
+        # Only cache real answers, not error messages from the generator
+        if not response.startswith(("Error generating", "Unable to complete search")):
+            await asyncio.to_thread(self.response_cache.store, query, history, response, sources, query_embedding)
+    
     def get_course_analytics(self) -> Dict:
         """Get analytics about the course catalog"""
         return {
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import time
+from typing import List, Optional, Tuple
+
+
+class SemanticResponseCache:
+    """Caches final answers in ChromaDB so similar repeat queries skip the AI round-trips"""
+
+    def __init__(self, vector_store, similarity_threshold: float = 0.95, ttl_seconds: int = 3600):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.vector_store = vector_store
+        self.collection = self._create_collection()
+
+    def _create_collection(self):
+        """Create or get the response cache collection using the store's embedding function"""
+        return self.vector_store.client.get_or_create_collection(
+            name="response_cache",
+            embedding_function=self.vector_store.embedding_function,
+            metadata={"hnsw:space": "cosine"}  # Distance becomes 1 - cosine similarity
+        )
+
+    @staticmethod
+    def _history_hash(conversation_history: Optional[str]) -> str:
+        """Hash the conversation history so answers are only reused in the same context"""
+        return hashlib.sha256((conversation_history or "").encode("utf-8")).hexdigest()
+
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """Embed a query once so lookup and store can share the vector"""
+        try:
+            return list(self.vector_store.embedding_function([query])[0])
+        except Exception as e:
+            print(f"Error embedding query for response cache: {e}")
+            return None
+
+    def lookup(self, query: str, conversation_history: Optional[str] = None,
+               query_embedding: Optional[List[float]] = None) -> Optional[Tuple[str, List]]:
+        """
+        Find a cached answer for a semantically similar query.
+
+        Args:
+            query: User's question
+            conversation_history: Formatted conversation history, if any
+            query_embedding: Precomputed embedding of the query, if available
+
+        Returns:
+            Tuple of (answer, sources) on a cache hit, None otherwise
+        """
+        if query_embedding is not None:
+            query_input = {"query_embeddings": [query_embedding]}
+        else:
+            query_input = {"query_texts": [query]}
+
+        try:
+            results = self.collection.query(
+                **query_input,
+                n_results=1,
+                where={"history_hash": self._history_hash(conversation_history)}
+            )
+
+            if not results['documents'][0]:
+                return None
+
+            similarity = 1 - results['distances'][0][0]
+            metadata = results['metadatas'][0][0]
+
+            if similarity < self.similarity_threshold:
+                return None
+
+            # Every answer expires, including "nothing found" ones, so changed
+            # course content is picked up; entries without an expiry are stale
+            if metadata.get('expires_at', 0) < time.time():
+                return None
+
+            return metadata['answer'], json.loads(metadata['sources_json'])
+        except Exception as e:
+            print(f"Error looking up response cache: {e}")
+            return None
+
+    def store(self, query: str, conversation_history: Optional[str], answer: str, sources: List,
+              query_embedding: Optional[List[float]] = None):
+        """Store a generated answer and its sources for later reuse"""
+        history_hash = self._history_hash(conversation_history)
+
+        # Reuse the lookup embedding rather than having Chroma embed the query again
+        embedding_input = {"embeddings": [query_embedding]} if query_embedding is not None else {}
+
+        # An answer without sources may still reflect a search that found nothing,
+        # so it goes stale when course content changes just like a sourced one
+        expires_at = time.time() + self.ttl_seconds
+
+        try:
+            self.collection.upsert(
+                documents=[query],
+                metadatas=[{
+                    "history_hash": history_hash,
+                    "answer": answer,
+                    "sources_json": json.dumps(sources),
+                    "expires_at": expires_at
+                }],
+                ids=[hashlib.sha256(f"{history_hash}:{query}".encode("utf-8")).hexdigest()],
+                **embedding_input
+            )
+        except Exception as e:
+            print(f"Error storing response cache entry: {e}")
+
+    def clear(self):
+        """Drop all cached responses"""
+        try:
+            self.vector_store.client.delete_collection("response_cache")
+            self.collection = self._create_collection()
+        except Exception as e:
+            print(f"Error clearing response cache: {e}")
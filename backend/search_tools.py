@@ -1,8 +1,17 @@
-from typing import Dict, Any, Optional, Protocol
+import asyncio
+import sys
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Protocol
 from abc import ABC, abstractmethod
+import orjson
 from vector_store import VectorStore, SearchResults
 
 
+# Source list of the tool call running in the current worker thread; set by
+# ToolManager._run_tool so each call reports into its own request's slot
+_call_sources: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("call_sources", default=None)
+
+
 class Tool(ABC):
     """Abstract base class for all tools"""
     
@@ -15,6 +24,43 @@ class Tool(ABC):
     def execute(self, **kwargs) -> str:
         """Execute the tool with given parameters"""
         pass
+    
+    def _record_sources(self, sources: List[Dict[str, Any]]) -> None:
+        """
+        Report the sources of this execution.
+        
+        They go to the calling request's slot when run through a
+        RequestToolManager; last_sources only reflects the latest direct call
+        and is not safe to read while requests run concurrently.
+        """
+        self.last_sources = sources
+        call_sources = _call_sources.get()
+        if call_sources is not None:
+            call_sources.extend(sources)
+
+
+SEARCH_TOOL_DEFINITION: Dict[str, Any] = {
+    "name": "search_course_content",
+    "description": "Search inside course materials for specific content, topics, concepts, or explanations. Use this to find detailed information WITHIN lessons.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string", 
+                "description": "What to search for in the course content"
+            },
+            "course_name": {
+                "type": "string",
+                "description": "Course title (partial matches work, e.g. 'MCP', 'Introduction')"
+            },
+            "lesson_number": {
+                "type": "integer",
+                "description": "Specific lesson number to search within (e.g. 1, 2, 3)"
+            }
+        },
+        "required": ["query"]
+    }
+}
 
 
 class CourseSearchTool(Tool):
@@ -25,29 +71,8 @@ class CourseSearchTool(Tool):
         self.last_sources = []  # Track sources from last search
     
     def get_tool_definition(self) -> Dict[str, Any]:
-        """Return Anthropic tool definition for this tool"""
-        return {
-            "name": "search_course_content",
-            "description": "Search inside course materials for specific content, topics, concepts, or explanations. Use this to find detailed information WITHIN lessons.",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string", 
-                        "description": "What to search for in the course content"
-                    },
-                    "course_name": {
-                        "type": "string",
-                        "description": "Course title (partial matches work, e.g. 'MCP', 'Introduction')"
-                    },
-                    "lesson_number": {
-                        "type": "integer",
-                        "description": "Specific lesson number to search within (e.g. 1, 2, 3)"
-                    }
-                },
-                "required": ["query"]
-            }
-        }
+        """Return Anthropic tool definition for this tool (shared constant, do not mutate)"""
+        return SEARCH_TOOL_DEFINITION
     
     def execute(self, query: str, course_name: Optional[str] = None, lesson_number: Optional[int] = None) -> str:
         """
@@ -69,27 +94,34 @@ class CourseSearchTool(Tool):
             lesson_number=lesson_number
         )
         
-        # Handle errors
         if results.error:
             return results.error
-        
-        # Handle empty results
-        if results.is_empty():
-            filter_info = ""
-            if course_name:
-                filter_info += f" in course '{course_name}'"
-            if lesson_number:
-                filter_info += f" in lesson {lesson_number}"
-            return f"No relevant content found{filter_info}."
-        
-        # Format and return results
+        if not results.documents:
+            return self._empty_message(course_name, lesson_number)
         return self._format_results(results)
     
+    @staticmethod
+    def _empty_message(course_name: Optional[str], lesson_number: Optional[int]) -> str:
+        """Build the no-results message describing any filters that were applied"""
+        filter_info = ""
+        if course_name:
+            filter_info += f" in course '{course_name}'"
+        if lesson_number:
+            filter_info += f" in lesson {lesson_number}"
+        return f"No relevant content found{filter_info}."
+    
     def _format_results(self, results: SearchResults) -> str:
         """Format search results with course and lesson context"""
         formatted = []
         sources = []  # Track sources for the UI with links
         
+        # Fetch lesson links for every referenced course in a single catalog read
+        linked_titles = {
+            meta.get('course_title') for meta in results.metadata
+            if meta.get('lesson_number') is not None and meta.get('course_title', 'unknown') != 'unknown'
+        }
+        lesson_links = self.store.get_lesson_links(list(linked_titles)) if linked_titles else {}
+        
         for doc, meta in zip(results.documents, results.metadata):
             course_title = meta.get('course_title', 'unknown')
             lesson_num = meta.get('lesson_number')
@@ -105,10 +137,7 @@ class CourseSearchTool(Tool):
             if lesson_num is not None:
                 source_text += f" - Lesson {lesson_num}"
             
-            # Try to get lesson link if we have lesson number
-            lesson_link = None
-            if lesson_num is not None and course_title != 'unknown':
-                lesson_link = self.store.get_lesson_link(course_title, lesson_num)
+            lesson_link = lesson_links.get((course_title, lesson_num))
             
             # Create source object with text and optional link
             source_obj = {"text": source_text}
@@ -119,11 +148,27 @@ class CourseSearchTool(Tool):
             formatted.append(f"{header}\n{doc}")
         
         # Store sources for retrieval
-        self.last_sources = sources
+        self._record_sources(sources)
         
         return "\n\n".join(formatted)
 
 
+OUTLINE_TOOL_DEFINITION: Dict[str, Any] = {
+    "name": "get_course_outline",
+    "description": "Get course structure, lesson list, titles, and navigation info. Use this to understand WHAT lessons exist and course organization, NOT to search content within lessons.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "course_name": {
+                "type": "string",
+                "description": "Course title or partial course name to get outline for"
+            }
+        },
+        "required": ["course_name"]
+    }
+}
+
+
 class CourseOutlineTool(Tool):
     """Tool for getting course outlines with complete lesson information"""
     
@@ -132,21 +177,8 @@ class CourseOutlineTool(Tool):
         self.last_sources = []  # Track sources from last search
     
     def get_tool_definition(self) -> Dict[str, Any]:
-        """Return Anthropic tool definition for this tool"""
-        return {
-            "name": "get_course_outline",
-            "description": "Get course structure, lesson list, titles, and navigation info. Use this to understand WHAT lessons exist and course organization, NOT to search content within lessons.",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "course_name": {
-                        "type": "string",
-                        "description": "Course title or partial course name to get outline for"
-                    }
-                },
-                "required": ["course_name"]
-            }
-        }
+        """Return Anthropic tool definition for this tool (shared constant, do not mutate)"""
+        return OUTLINE_TOOL_DEFINITION
     
     def execute(self, course_name: str) -> str:
         """
@@ -164,7 +196,6 @@ class CourseOutlineTool(Tool):
             return f"No course found matching '{course_name}'"
         
         # Get course metadata
-        import json
         try:
             results = self.store.course_catalog.get(ids=[course_title])
             if not results or not results['metadatas'] or not results['metadatas'][0]:
@@ -177,7 +208,7 @@ class CourseOutlineTool(Tool):
             if not lessons_json:
                 return f"No lesson information available for '{course_title}'"
             
-            lessons = json.loads(lessons_json)
+            lessons = orjson.loads(lessons_json)
             
             # Format the output
             formatted_output = f"**{course_title}**\n"
@@ -200,7 +231,7 @@ class CourseOutlineTool(Tool):
             if course_link:
                 source_obj["link"] = course_link
             
-            self.last_sources = [source_obj]
+            self._record_sources([source_obj])
             
             return formatted_output
             
@@ -213,6 +244,8 @@ class ToolManager:
     
     def __init__(self):
         self.tools = {}
+        self._source_tools = []  # Tools that track last_sources, resolved at registration
+        self._definitions_cache: Optional[list] = None  # Rebuilt only when tools change
     
     def register_tool(self, tool: Tool):
         """Register any tool that implements the Tool interface"""
@@ -220,30 +253,81 @@ class ToolManager:
         tool_name = tool_def.get("name")
         if not tool_name:
             raise ValueError("Tool must have a 'name' in its definition")
-        self.tools[tool_name] = tool
+        self.tools[sys.intern(tool_name)] = tool
+        self._source_tools = [t for t in self.tools.values() if hasattr(t, 'last_sources')]
+        self._definitions_cache = None
 
     
     def get_tool_definitions(self) -> list:
-        """Get all tool definitions for Anthropic tool calling"""
-        return [tool.get_tool_definition() for tool in self.tools.values()]
+        """Get all tool definitions for Anthropic tool calling (shared list, do not mutate)"""
+        if self._definitions_cache is None:
+            self._definitions_cache = [tool.get_tool_definition() for tool in self.tools.values()]
+        return self._definitions_cache
     
     def execute_tool(self, tool_name: str, **kwargs) -> str:
         """Execute a tool by name with given parameters"""
-        if tool_name not in self.tools:
+        return self._run_tool(None, tool_name, kwargs)
+    
+    async def execute_tool_async(self, tool_name: str, **kwargs) -> str:
+        """Execute a tool by name in a worker thread so blocking vector store calls can overlap"""
+        return await asyncio.to_thread(self._run_tool, None, tool_name, kwargs)
+    
+    def _run_tool(self, call_sources: Optional[list], tool_name: str, kwargs: Dict[str, Any]) -> str:
+        """Execute a tool, routing any sources it records into call_sources"""
+        tool = self.tools.get(tool_name)
+        if tool is None:
             return f"Tool '{tool_name}' not found"
         
-        return self.tools[tool_name].execute(**kwargs)
+        token = _call_sources.set(call_sources)
+        try:
+            return tool.execute(**kwargs)
+        finally:
+            _call_sources.reset(token)
+    
+    def for_request(self) -> "RequestToolManager":
+        """Get a view of this manager that keeps the sources of one request's tool calls"""
+        return RequestToolManager(self)
     
     def get_last_sources(self) -> list:
-        """Get sources from the last search operation"""
-        # Check all tools for last_sources attribute
-        for tool in self.tools.values():
-            if hasattr(tool, 'last_sources') and tool.last_sources:
+        """Get sources from the last direct search operation (not per request; see for_request)"""
+        for tool in self._source_tools:
+            if tool.last_sources:
                 return tool.last_sources
         return []
 
     def reset_sources(self):
         """Reset sources from all tools that track sources"""
-        for tool in self.tools.values():
-            if hasattr(tool, 'last_sources'):
-                tool.last_sources = []
\ No newline at end of file
+        for tool in self._source_tools:
+            tool.last_sources = []
+
+
+class RequestToolManager:
+    """Per-request view of a ToolManager that collects the sources of its own tool calls"""
+    
+    def __init__(self, manager: ToolManager):
+        self._manager = manager
+        self._call_sources: List[List[Dict[str, Any]]] = []
+    
+    def _reserve(self) -> List[Dict[str, Any]]:
+        """Reserve the source slot for the next call, in the order calls are issued"""
+        call_sources: List[Dict[str, Any]] = []
+        self._call_sources.append(call_sources)
+        return call_sources
+    
+    def get_tool_definitions(self) -> list:
+        """Get all tool definitions from the underlying manager"""
+        return self._manager.get_tool_definitions()
+    
+    def execute_tool(self, tool_name: str, **kwargs) -> str:
+        """Execute a tool by name, keeping its sources for this request"""
+        return self._manager._run_tool(self._reserve(), tool_name, kwargs)
+    
+    async def execute_tool_async(self, tool_name: str, **kwargs) -> str:
+        """Execute a tool in a worker thread, keeping its sources for this request"""
+        # Reserve before the thread hop so concurrent calls keep their issue order
+        call_sources = self._reserve()
+        return await asyncio.to_thread(self._manager._run_tool, call_sources, tool_name, kwargs)
+    
+    def get_sources(self) -> list:
+        """Get the sources of every tool call made through this view, in call order"""
+        return [source for call_sources in self._call_sources for source in call_sources]
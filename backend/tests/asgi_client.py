@@ -0,0 +1,33 @@
+"""
+Synchronous test client that dispatches requests straight into an ASGI app.
+
+Shared by the API test modules in place of fastapi.testclient.TestClient.
+"""
+
+import asyncio
+import httpx
+
+
+class ASGIClient:
+    """Sync facade over httpx.AsyncClient that dispatches straight into the app on one event loop"""
+    
+    def __init__(self, app):
+        self.app = app
+        self._loop = asyncio.new_event_loop()
+        self._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver")
+    
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return self._loop.run_until_complete(self._client.request(method, url, **kwargs))
+    
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+    
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+    
+    def options(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("OPTIONS", url, **kwargs)
+    
+    def close(self):
+        self._loop.run_until_complete(self._client.aclose())
+        self._loop.close()
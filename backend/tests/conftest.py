@@ -5,27 +5,29 @@ This module provides common fixtures, mocks, and test utilities used across
 all test files in the test suite.
 """
 
+import copy
 import pytest
 import tempfile
-import shutil
 import os
+from types import MappingProxyType, SimpleNamespace
 from unittest.mock import Mock, MagicMock, patch
-from typing import Dict, List, Any, Optional
-from fastapi.testclient import TestClient
-
-import sys
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from typing import Dict, List, Any, Optional, Final, Mapping
 
 # Import modules without importing the main app to avoid static file issues
-try:
-    from config import Config
-    from models import Course, Lesson, CourseChunk
-except ImportError:
-    # Fallback if imports fail
-    Config = None
-    Course = None
-    Lesson = None
-    CourseChunk = None
+from models import Course, Lesson, CourseChunk
+
+
+# Default session manager behaviour, applied on creation and on every reset
+_SM_DEFAULTS = {
+    "create_session.return_value": "test_session_123",
+    "clear_session.return_value": None,
+    "get_session_history.return_value": [],
+}
+
+
+def _make_sm() -> Mock:
+    """Build a mock session manager configured with the defaults."""
+    return Mock(**_SM_DEFAULTS)
 
 
 class MockRAGSystem:
@@ -37,24 +39,11 @@ class MockRAGSystem:
     """
 
     def __init__(self):
-        self.should_fail = False
-        self.should_timeout = False
-        self.query_response = "Test response from RAG system"
-        self.query_sources = [{"text": "Test source", "link": "http://example.com"}]
-        self.session_id = "test_session_123"
-        self.analytics_data = {
-            "total_courses": 3,
-            "course_titles": ["Introduction to Python", "Advanced JavaScript", "Data Science Fundamentals"]
-        }
-        self.queries_received = []
-
         # Mock session manager
-        self.session_manager = Mock()
-        self.session_manager.create_session.return_value = self.session_id
-        self.session_manager.clear_session.return_value = None
-        self.session_manager.get_session_history.return_value = []
+        self.session_manager = _make_sm()
+        self.reset()
 
-    def query(self, query_text: str, session_id: str = None) -> tuple:
+    async def query(self, query_text: str, session_id: str = None) -> tuple:
         """Mock query method with configurable responses."""
         self.queries_received.append({
             "query": query_text,
@@ -65,8 +54,7 @@ class MockRAGSystem:
             raise Exception("Mock RAG system error")
 
         if self.should_timeout:
-            import time
-            time.sleep(10)  # Simulate timeout
+            raise TimeoutError("mock timeout")  # Fail fast instead of stalling the suite
 
         return self.query_response, self.query_sources
 
@@ -82,11 +70,21 @@ class MockRAGSystem:
         return 3, 150  # courses, chunks
 
     def reset(self):
-        """Reset mock state between tests."""
+        """Restore every default so a shared instance carries nothing between tests."""
         self.should_fail = False
         self.should_timeout = False
+        self.query_response = "Test response from RAG system"
+        self.query_sources = [{"text": "Test source", "link": "http://example.com"}]
+        self.session_id = "test_session_123"
+        self.analytics_data = {
+            "total_courses": 3,
+            "course_titles": ["Introduction to Python", "Advanced JavaScript", "Data Science Fundamentals"]
+        }
         self.queries_received = []
 
+        self.session_manager.reset_mock(return_value=True, side_effect=True)
+        self.session_manager.configure_mock(**_SM_DEFAULTS)
+
 
 class MockConfig:
     """Mock configuration for testing."""
@@ -100,17 +98,61 @@ class MockConfig:
         self.DOCS_FOLDER = "./test_docs"
 
 
+@pytest.fixture(scope="module")
+def _module_rag_system():
+    """Single MockRAGSystem shared by every test in a module."""
+    return MockRAGSystem()
+
+
 @pytest.fixture
-def mock_rag_system():
+def mock_rag_system(_module_rag_system):
     """
     Fixture providing a mock RAG system for testing.
 
+    The instance is shared per module and reset before each test.
+
     Returns:
         MockRAGSystem: Configured mock RAG system
     """
-    mock_system = MockRAGSystem()
-    yield mock_system
-    mock_system.reset()
+    _module_rag_system.reset()
+    return _module_rag_system
+
+
+@pytest.fixture(scope="session")
+def _mock_rag_pool():
+    """Pool of MockRAGSystem instances reused by make_mock_rag across the session."""
+    return []
+
+
+@pytest.fixture
+def make_mock_rag(_mock_rag_pool):
+    """
+    Factory fixture for differently configured mock RAG systems.
+
+    Usage:
+        failing_rag = make_mock_rag(should_fail=True)
+        rag = make_mock_rag(query_response="Answer", query_sources=[])
+
+    Instances come from a session-wide pool, are reset before being handed
+    out and return to the pool after the test.
+
+    Returns:
+        Callable[..., MockRAGSystem]: Factory accepting MockRAGSystem attributes
+    """
+    handed_out = []
+
+    def _factory(**attributes):
+        mock_system = _mock_rag_pool.pop() if _mock_rag_pool else MockRAGSystem()
+        mock_system.reset()
+        for name, value in attributes.items():
+            if not hasattr(mock_system, name):
+                raise AttributeError(f"MockRAGSystem has no attribute '{name}'")
+            setattr(mock_system, name, value)
+        handed_out.append(mock_system)
+        return mock_system
+
+    yield _factory
+    _mock_rag_pool.extend(handed_out)
 
 
 @pytest.fixture
@@ -124,20 +166,60 @@ def mock_config():
     return MockConfig()
 
 
-@pytest.fixture
-def api_client():
+def _build_sample_data():
     """
-    Fixture providing a FastAPI test client.
-
-    This client is configured to work with the mocked RAG system
-    and avoids issues with static file serving in the test environment.
-
-    Returns:
-        TestClient: Configured FastAPI test client
+    Build the read-only sample courses and chunks once at import time.
     """
-    # This fixture is deprecated in favor of test_app_client in test_api_endpoints.py
-    # which creates its own test app without static file mounting issues
-    pytest.skip("Use test_app_client fixture from test_api_endpoints.py instead")
+    courses = (
+        Course(
+            title="Introduction to Python",
+            instructor="Dr. Jane Smith",
+            lessons=[
+                Lesson(lesson_number=1, title="Variables and Data Types"),
+                Lesson(lesson_number=2, title="Control Structures"),
+            ]
+        ),
+        Course(
+            title="Advanced JavaScript",
+            instructor="Prof. John Doe",
+            lessons=[
+                Lesson(lesson_number=1, title="Async Programming"),
+                Lesson(lesson_number=2, title="ES6 Features"),
+            ]
+        ),
+        Course(
+            title="Data Science Fundamentals",
+            instructor="Dr. Alice Johnson",
+            lessons=[
+                Lesson(lesson_number=1, title="Data Analysis"),
+                Lesson(lesson_number=2, title="Visualization"),
+            ]
+        )
+    )
+    chunks = (
+        CourseChunk(
+            course_title="Introduction to Python",
+            lesson_number=1,
+            content="Python variables are containers for storing data values...",
+            chunk_index=0
+        ),
+        CourseChunk(
+            course_title="Introduction to Python",
+            lesson_number=2,
+            content="Python has several control structures like if statements...",
+            chunk_index=1
+        ),
+        CourseChunk(
+            course_title="Advanced JavaScript",
+            lesson_number=1,
+            content="JavaScript async programming allows non-blocking operations...",
+            chunk_index=0
+        )
+    )
+    return courses, chunks
+
+
+_CACHED_COURSES, _CACHED_CHUNKS = _build_sample_data()
 
 
 @pytest.fixture
@@ -145,61 +227,13 @@ def sample_courses():
     """
     Fixture providing sample course data for testing.
 
+    The models are validated once at import; each test gets its own deep copy,
+    so mutating them cannot leak into other tests.
+
     Returns:
-        List[Dict] or List[Course]: List of sample course objects or dicts
+        Tuple[Course]: Sample course objects
     """
-    if Course and Lesson:
-        return [
-            Course(
-                title="Introduction to Python",
-                instructor="Dr. Jane Smith",
-                description="A comprehensive introduction to Python programming",
-                lessons=[
-                    Lesson(title="Variables and Data Types", content="Learn about Python variables..."),
-                    Lesson(title="Control Structures", content="Understanding loops and conditionals..."),
-                ]
-            ),
-            Course(
-                title="Advanced JavaScript",
-                instructor="Prof. John Doe",
-                description="Advanced concepts in JavaScript development",
-                lessons=[
-                    Lesson(title="Async Programming", content="Understanding promises and async/await..."),
-                    Lesson(title="ES6 Features", content="Modern JavaScript features..."),
-                ]
-            ),
-            Course(
-                title="Data Science Fundamentals",
-                instructor="Dr. Alice Johnson",
-                description="Introduction to data science concepts",
-                lessons=[
-                    Lesson(title="Data Analysis", content="Working with pandas and numpy..."),
-                    Lesson(title="Visualization", content="Creating charts with matplotlib..."),
-                ]
-            )
-        ]
-    else:
-        # Return dictionary data if models aren't available
-        return [
-            {
-                "title": "Introduction to Python",
-                "instructor": "Dr. Jane Smith",
-                "description": "A comprehensive introduction to Python programming",
-                "lessons": [
-                    {"title": "Variables and Data Types", "content": "Learn about Python variables..."},
-                    {"title": "Control Structures", "content": "Understanding loops and conditionals..."},
-                ]
-            },
-            {
-                "title": "Advanced JavaScript",
-                "instructor": "Prof. John Doe",
-                "description": "Advanced concepts in JavaScript development",
-                "lessons": [
-                    {"title": "Async Programming", "content": "Understanding promises and async/await..."},
-                    {"title": "ES6 Features", "content": "Modern JavaScript features..."},
-                ]
-            }
-        ]
+    return copy.deepcopy(_CACHED_COURSES)
 
 
 @pytest.fixture
@@ -207,71 +241,18 @@ def sample_chunks():
     """
     Fixture providing sample course chunks for testing.
 
-    Returns:
-        List[CourseChunk] or List[Dict]: List of sample course chunk objects or dicts
-    """
-    if CourseChunk:
-        return [
-            CourseChunk(
-                course_title="Introduction to Python",
-                lesson_title="Variables and Data Types",
-                content="Python variables are containers for storing data values...",
-                chunk_id="python_vars_1"
-            ),
-            CourseChunk(
-                course_title="Introduction to Python",
-                lesson_title="Control Structures",
-                content="Python has several control structures like if statements...",
-                chunk_id="python_control_1"
-            ),
-            CourseChunk(
-                course_title="Advanced JavaScript",
-                lesson_title="Async Programming",
-                content="JavaScript async programming allows non-blocking operations...",
-                chunk_id="js_async_1"
-            )
-        ]
-    else:
-        # Return dictionary data if models aren't available
-        return [
-            {
-                "course_title": "Introduction to Python",
-                "lesson_title": "Variables and Data Types",
-                "content": "Python variables are containers for storing data values...",
-                "chunk_id": "python_vars_1"
-            },
-            {
-                "course_title": "Introduction to Python",
-                "lesson_title": "Control Structures",
-                "content": "Python has several control structures like if statements...",
-                "chunk_id": "python_control_1"
-            },
-            {
-                "course_title": "Advanced JavaScript",
-                "lesson_title": "Async Programming",
-                "content": "JavaScript async programming allows non-blocking operations...",
-                "chunk_id": "js_async_1"
-            }
-        ]
-
-
-@pytest.fixture
-def temp_docs_folder():
-    """
-    Fixture providing a temporary docs folder for testing.
-
-    Creates a temporary directory with sample document files,
-    then cleans up after the test.
+    The models are validated once at import; each test gets its own deep copy,
+    so mutating them cannot leak into other tests.
 
     Returns:
-        str: Path to temporary docs folder
+        Tuple[CourseChunk]: Sample course chunk objects
     """
-    temp_dir = tempfile.mkdtemp(prefix="test_docs_")
+    return copy.deepcopy(_CACHED_CHUNKS)
+
 
-    # Create sample documents
-    sample_docs = {
-        "python_course.txt": """
-Introduction to Python
+# Sample course documents, written to disk once per session
+_SAMPLE_DOCS: Dict[str, str] = {
+    "python_course.txt": """Introduction to Python
 
 Instructor: Dr. Jane Smith
 
@@ -279,10 +260,8 @@ Lesson 1: Variables and Data Types
 Python variables are containers for storing data values. Unlike other programming languages, Python has no command for declaring a variable.
 
 Lesson 2: Control Structures
-Python uses indentation to indicate a block of code. Control structures like if statements, for loops, and while loops are essential.
-        """,
-        "javascript_course.txt": """
-Advanced JavaScript
+Python uses indentation to indicate a block of code. Control structures like if statements, for loops, and while loops are essential.""",
+    "javascript_course.txt": """Advanced JavaScript
 
 Instructor: Prof. John Doe
 
@@ -290,18 +269,42 @@ Lesson 1: Async Programming
 JavaScript async programming allows you to perform non-blocking operations using promises and async/await syntax.
 
 Lesson 2: ES6 Features
-Modern JavaScript includes many new features like arrow functions, destructuring, and template literals.
-        """
-    }
+Modern JavaScript includes many new features like arrow functions, destructuring, and template literals."""
+}
 
-    for filename, content in sample_docs.items():
-        with open(os.path.join(temp_dir, filename), 'w') as f:
-            f.write(content.strip())
 
-    yield temp_dir
+@pytest.fixture(scope="session")
+def _session_docs_folder(tmp_path_factory):
+    """
+    Write the sample document files once per session.
+
+    Returns:
+        str: Path to the shared, read-only docs folder
+    """
+    temp_dir = tmp_path_factory.mktemp("docs")
+
+    for filename, text in _SAMPLE_DOCS.items():
+        (temp_dir / filename).write_text(text)
 
-    # Cleanup
-    shutil.rmtree(temp_dir)
+    return str(temp_dir)
+
+
+@pytest.fixture
+def temp_docs_folder(_session_docs_folder, tmp_path):
+    """
+    Fixture providing a temporary docs folder for testing.
+
+    Each test gets its own directory, so files can be added or removed freely.
+    The sample documents are hard links to the session copies, so tests must
+    not modify their contents in place.
+
+    Returns:
+        str: Path to temporary docs folder
+    """
+    for filename in os.listdir(_session_docs_folder):
+        os.link(os.path.join(_session_docs_folder, filename), tmp_path / filename)
+
+    return str(tmp_path)
 
 
 @pytest.fixture
@@ -315,32 +318,61 @@ def temp_db_path():
     Returns:
         str: Path to temporary database directory
     """
-    temp_dir = tempfile.mkdtemp(prefix="test_chroma_db_")
-    yield temp_dir
+    with tempfile.TemporaryDirectory(prefix="test_chroma_db_") as temp_dir:
+        yield temp_dir
+
+
+# Fixed message returned by the mock client; built once and never mutated
+_ANTHROPIC_RESPONSE = SimpleNamespace(content=[SimpleNamespace(text="Mock AI response")])
 
-    # Cleanup
-    if os.path.exists(temp_dir):
-        shutil.rmtree(temp_dir)
+
+def _build_anthropic_client() -> MagicMock:
+    """Build a mock Anthropic client whose create() returns a fixed message."""
+    client = MagicMock()
+    client.messages.create.return_value = _ANTHROPIC_RESPONSE
+    return client
+
+
+@pytest.fixture(scope="module")
+def _module_anthropic_client():
+    """Single mock Anthropic client shared by every test in a module."""
+    return _build_anthropic_client()
 
 
 @pytest.fixture
-def mock_anthropic_client():
+def mock_anthropic_client(_module_anthropic_client):
     """
     Fixture providing a mock Anthropic API client.
 
+    The client is shared per module; call records and side effects are
+    cleared after each test while the configured response is kept.
+
     Returns:
-        Mock: Mock Anthropic client with configurable responses
+        MagicMock: Mock Anthropic client with configurable responses
     """
-    mock_client = Mock()
-
-    # Mock message response
-    mock_message = Mock()
-    mock_message.content = [Mock()]
-    mock_message.content[0].text = "Mock AI response"
-
-    mock_client.messages.create.return_value = mock_message
-
-    return mock_client
+    yield _module_anthropic_client
+    _module_anthropic_client.reset_mock(return_value=False, side_effect=True)
+
+
+# Common API error scenarios and their expected responses (read-only); the
+# exceptions themselves are built per test by the api_error_scenarios fixture
+API_ERROR_SCENARIOS: Final[Mapping[str, Dict[str, Any]]] = MappingProxyType({
+    "credit_low": {
+        "message": "credit balance is too low",
+        "status_code": 402,
+        "message_contains": "credit balance too low"
+    },
+    "invalid_request": {
+        "message": "invalid_request_error: bad parameters",
+        "status_code": 400,
+        "message_contains": "API request error"
+    },
+    "generic_error": {
+        "message": "Internal server error",
+        "status_code": 500,
+        "message_contains": "Internal server error"
+    }
+})
 
 
 @pytest.fixture
@@ -348,77 +380,81 @@ def api_error_scenarios():
     """
     Fixture providing common API error scenarios for testing.
 
+    Each test gets fresh exception instances, so a raise in one test does not
+    leave its traceback attached to an exception shared with the next.
+
     Returns:
-        Dict: Dictionary of error scenarios and their expected responses
+        Dict: Error scenarios with an "exception" to raise and the expected response
     """
     return {
-        "credit_low": {
-            "exception": Exception("credit balance is too low"),
-            "status_code": 402,
-            "message_contains": "credit balance too low"
-        },
-        "invalid_request": {
-            "exception": Exception("invalid_request_error: bad parameters"),
-            "status_code": 400,
-            "message_contains": "API request error"
-        },
-        "generic_error": {
-            "exception": Exception("Internal server error"),
-            "status_code": 500,
-            "message_contains": "Internal server error"
-        }
+        key: {**scenario, "exception": Exception(scenario["message"])}
+        for key, scenario in API_ERROR_SCENARIOS.items()
     }
 
 
-@pytest.fixture(autouse=True)
+@pytest.fixture(scope="session", autouse=True)
 def setup_test_environment():
     """
-    Fixture that runs before each test to set up the test environment.
+    Fixture that sets up the test environment once for the whole session.
 
-    This fixture automatically runs before each test and ensures:
-    - Clean state for each test
-    - Proper environment variables
-    - Mock external dependencies
+    Setting the environment is idempotent, so it does not need to run per test.
+    Per-test cleanup, if ever required, belongs in a separate function-scoped fixture.
     """
     # Set test environment variables
     os.environ["ANTHROPIC_API_KEY"] = "test_key"
 
     yield
 
-    # Cleanup after test
-    # Remove any test-specific environment variables if needed
 
+# Test queries and expected responses (read-only)
+QUERY_TEST_DATA: Final[Mapping[str, Dict[str, Any]]] = MappingProxyType({
+    "simple_query": {
+        "query": "What is Python?",
+        "expected_answer": "Python is a programming language",
+        "expected_sources": [{"text": "Python documentation", "link": "http://python.org"}]
+    },
+    "course_specific": {
+        "query": "Tell me about variables in the Python course",
+        "expected_answer": "Variables in Python are containers for data",
+        "expected_sources": [{"text": "Python course lesson 1"}]
+    },
+    "empty_query": {
+        "query": "",
+        "expected_answer": "Please provide a question",
+        "expected_sources": []
+    },
+    "unicode_query": {
+        "query": "What is Python? 中文 émojis 🐍",
+        "expected_answer": "Python with unicode support",
+        "expected_sources": []
+    }
+})
 
-@pytest.fixture
+
+@pytest.fixture(scope="session")
 def query_test_data():
     """
     Fixture providing test data for query testing.
 
     Returns:
-        Dict: Test queries and expected responses
+        Mapping: Read-only test queries and expected responses
     """
-    return {
-        "simple_query": {
-            "query": "What is Python?",
-            "expected_answer": "Python is a programming language",
-            "expected_sources": [{"text": "Python documentation", "link": "http://python.org"}]
-        },
-        "course_specific": {
-            "query": "Tell me about variables in the Python course",
-            "expected_answer": "Variables in Python are containers for data",
-            "expected_sources": [{"text": "Python course lesson 1"}]
-        },
-        "empty_query": {
-            "query": "",
-            "expected_answer": "Please provide a question",
-            "expected_sources": []
-        },
-        "unicode_query": {
-            "query": "What is Python? 中文 émojis 🐍",
-            "expected_answer": "Python with unicode support",
-            "expected_sources": []
-        }
-    }
+    return QUERY_TEST_DATA
+
+
+# One pytest.param per query scenario so each runs (and is reported) as its own test
+QUERY_SCENARIOS = [pytest.param(data, id=name) for name, data in QUERY_TEST_DATA.items()]
+
+
+@pytest.fixture(params=QUERY_SCENARIOS)
+def query_scenario(request):
+    """
+    Fixture parametrizing a test over every scenario in QUERY_TEST_DATA.
+
+    Returns:
+        Dict: Query, expected answer and expected sources for one scenario
+    """
+    return request.param
 
 
 # Mark slow tests
@@ -4,12 +4,80 @@ Diagnostic script to test all RAG system components.
 
 Run this script to verify the health of all backend components.
 Usage: uv run python diagnostic_script.py
+Set DIAGNOSTIC_LOG_LEVEL=DEBUG (or the app's DEBUG=1) to include full
+tracebacks for failures.
 """
 
+import asyncio
+import io
+import logging
 import sys
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 sys.path.append(os.path.dirname(__file__))
 
+log = logging.getLogger("diagnostic")
+
+
+class ThreadBufferedStdout(io.TextIOBase):
+    """Stdout proxy that sends each worker thread's output to its own buffer"""
+    
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+    
+    def run_buffered(self, func):
+        """Run func with this thread's output captured; returns (result, output)"""
+        self._local.buffer = io.StringIO()
+        try:
+            return func(), self._local.buffer.getvalue()
+        finally:
+            self._local.buffer = None
+    
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        return (buffer or self._stream).write(text)
+    
+    def flush(self):
+        self._stream.flush()
+
+_shared_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _build_rag():
+    from rag_system import RAGSystem
+    from config import config
+    return RAGSystem(config)
+
+
+def _rag():
+    """Shared RAGSystem so the embedding model loads once per diagnostic run"""
+    # Checks run concurrently, so serialize the first construction
+    with _shared_lock:
+        return _build_rag()
+
+
+def _vs():
+    """Shared VectorStore (the one owned by the shared RAGSystem)"""
+    return _rag().vector_store
+
+
+@lru_cache(maxsize=8)
+def _embed(text):
+    """Embedding for a probe query, computed once per diagnostic run"""
+    return list(_vs().embedding_function([text])[0])
+
+
+@lru_cache(maxsize=1)
+def _sample_search():
+    """Probe search, memoized so repeated checks don't re-embed the same query"""
+    query = "Python programming"
+    return _vs().search(query, limit=1, query_embedding=_embed(query))
+
+
 def test_configuration():
     """Test configuration and environment setup"""
     print("🔧 Testing Configuration...")
@@ -43,14 +111,11 @@ def test_vector_store():
     """Test vector store functionality"""
     print("\n🗃️  Testing Vector Store...")
     try:
-        from vector_store import VectorStore
-        from config import config
-        
-        vs = VectorStore(config.CHROMA_PATH, config.EMBEDDING_MODEL, config.MAX_RESULTS)
+        vs = _vs()
         
-        # Check course data
+        # Check course data; both values come from the same catalog read
         titles = vs.get_existing_course_titles()
-        count = vs.get_course_count()
+        count = len(titles)
         
         if count == 0:
             print("⚠️  No courses found in vector store")
@@ -59,7 +124,7 @@ def test_vector_store():
             print(f"📚 Courses: {', '.join(titles[:3])}{'...' if len(titles) > 3 else ''}")
         
         # Test search
-        results = vs.search("Python programming", limit=1)
+        results = _sample_search()
         if results.error:
             print(f"❌ Search failed: {results.error}")
             return False
@@ -72,8 +137,8 @@ def test_vector_store():
         
     except Exception as e:
         print(f"❌ Vector store test failed: {e}")
-        import traceback
-        traceback.print_exc()
+        # Full trace only when DIAGNOSTIC_LOG_LEVEL=DEBUG or DEBUG=1
+        log.debug("Vector store test failed", exc_info=True)
         return False
 
 def test_ai_generator():
@@ -86,7 +151,7 @@ def test_ai_generator():
         ai_gen = AIGenerator(config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL)
         
         # Test simple query
-        response = ai_gen.generate_response("What is 1+1?")
+        response = asyncio.run(ai_gen.generate_response("What is 1+1?"))
         if "2" in response:
             print("✅ AI Generator responding correctly")
             return True
@@ -106,13 +171,10 @@ def test_rag_system():
     """Test full RAG system"""
     print("\n🔄 Testing RAG System...")
     try:
-        from rag_system import RAGSystem
-        from config import config
-        
-        rag = RAGSystem(config)
+        rag = _rag()
         
         # Test with course content query
-        response, sources = rag.query("What is computer use with Anthropic?")
+        response, sources = asyncio.run(rag.query("What is computer use with Anthropic?"))
         
         if len(response) > 0:
             print(f"✅ RAG System generated {len(response)} character response")
@@ -171,19 +233,37 @@ def test_server_connectivity():
     """Test if server is accessible"""
     print("\n🖥️  Testing Server Connectivity...")
     try:
-        import requests
+        try:
+            import httpx
+        except ImportError:
+            httpx = None
+        
+        if httpx:
+            # Probe the root page and the API endpoint concurrently
+            async def _probe():
+                async with httpx.AsyncClient(timeout=10) as client:
+                    return await asyncio.gather(
+                        client.get('http://localhost:8000', timeout=5),
+                        client.post('http://localhost:8000/api/query',
+                                    json={'query': 'Test', 'session_id': None})
+                    )
+            
+            root_response, response = asyncio.run(_probe())
+        else:
+            import requests
+            
+            root_response = requests.get('http://localhost:8000', timeout=5)
+            response = requests.post('http://localhost:8000/api/query', 
+                                   json={'query': 'Test', 'session_id': None},
+                                   timeout=10)
         
         # Test root endpoint
-        response = requests.get('http://localhost:8000', timeout=5)
-        if response.status_code == 200:
+        if root_response.status_code == 200:
             print("✅ Server accessible on http://localhost:8000")
         else:
-            print(f"⚠️  Server returned {response.status_code}")
+            print(f"⚠️  Server returned {root_response.status_code}")
         
         # Test API endpoint directly
-        response = requests.post('http://localhost:8000/api/query', 
-                               json={'query': 'Test', 'session_id': None},
-                               timeout=10)
         if response.status_code == 200:
             print("✅ API endpoint accessible via HTTP")
             return True
@@ -192,11 +272,11 @@ def test_server_connectivity():
             return False
             
     except ImportError:
-        print("⚠️  requests library not available, skipping HTTP test")
+        print("⚠️  httpx/requests libraries not available, skipping HTTP test")
         return True
     except Exception as e:
         print(f"❌ Server connectivity test failed: {e}")
-        if "Connection refused" in str(e):
+        if "Connection refused" in str(e) or "connection attempts failed" in str(e):
             print("💡 Issue: Server may not be running. Start with: uv run uvicorn app:app --reload --port 8000 --host 0.0.0.0")
         return False
 
@@ -214,9 +294,27 @@ def main():
         ("Server Connectivity", test_server_connectivity),
     ]
     
+    # The checks are independent and mostly wait on I/O, so run them concurrently
+    # and print each one's buffered output in the original order afterwards
+    stdout = ThreadBufferedStdout(sys.stdout)
+    sys.stdout = stdout
+    # Log records go through the same proxy so they print with their check's output
+    log_handler = logging.StreamHandler(stdout)
+    log.addHandler(log_handler)
+    outcomes = {}
+    try:
+        with ThreadPoolExecutor(max_workers=len(tests)) as executor:
+            futures = {executor.submit(stdout.run_buffered, test_func): name for name, test_func in tests}
+            for future in as_completed(futures):
+                outcomes[futures[future]] = future.result()
+    finally:
+        log.removeHandler(log_handler)
+        sys.stdout = stdout._stream
+    
     results = {}
-    for name, test_func in tests:
-        results[name] = test_func()
+    for name, _ in tests:
+        results[name], output = outcomes[name]
+        print(output, end="")
     
     print("\n" + "=" * 50)
     print("📊 DIAGNOSTIC SUMMARY")
@@ -243,5 +341,7 @@ def main():
     return all_passed
 
 if __name__ == "__main__":
+    from config import config
+    log.setLevel(os.getenv("DIAGNOSTIC_LOG_LEVEL", "DEBUG" if config.DEBUG else "WARNING").upper())
     success = main()
     sys.exit(0 if success else 1)
\ No newline at end of file
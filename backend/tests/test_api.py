@@ -6,82 +6,81 @@ that could be causing the RAG chatbot to fail.
 """
 
 import pytest
-from fastapi.testclient import TestClient
-from unittest.mock import Mock, MagicMock, patch
+from unittest.mock import MagicMock, AsyncMock
 from typing import List, Dict, Any
-import json
-
-# Import the FastAPI app and dependencies
-import sys
+import orjson
 import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
 
-from app import app
+# Import the FastAPI app and dependencies
+from app import app, QueryResponse, SourceItem, CourseStats
 from rag_system import RAGSystem
 
+from .asgi_client import ASGIClient
+
+
+def _json(response) -> Any:
+    """Decode a response body once with orjson"""
+    return orjson.loads(response.content)
+
+
+_FRONTEND_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "frontend")
+
+# Pre-serialized bodies for payloads posted by several tests
+_JSON_HEADERS = {"content-type": "application/json"}
+_BODY_TEST_QUERY = orjson.dumps({"query": "Test query"})
+_BODY_SESSION = orjson.dumps({"session_id": "test_session"})
+_BODY_SLOW_QUERY = orjson.dumps({"query": "Slow query"})
+
+
+def make_patched_rag():
+    """Create a patched rag_system whose query coroutine can be awaited"""
+    return MagicMock(query=AsyncMock())
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Shared ASGI client for the app; lifespan events are not run, so no documents load"""
+    c = ASGIClient(app)
+    yield c
+    c.close()
+
+
+@pytest.fixture(scope="session")
+def large_query():
+    """Roughly 16 KB query string, built once per session"""
+    return "What is Python? " * 1000
+
+
+@pytest.fixture(scope="session")
+def unicode_query():
+    """Query mixing CJK, accented characters and emoji"""
+    return "What is Python? 中文 émojis 🐍"
 
-class MockRAGSystem:
-    """Mock RAG system for API testing"""
-    
-    def __init__(self):
-        self.should_fail = False
-        self.should_timeout = False
-        self.query_response = "Test response"
-        self.query_sources = []
-        self.session_id = "test_session_123"
-        self.analytics_data = {
-            "total_courses": 3,
-            "course_titles": ["Course 1", "Course 2", "Course 3"]
-        }
-        self.queries_received = []
-        
-        # Mock session manager
-        self.session_manager = Mock()
-        self.session_manager.create_session.return_value = self.session_id
-        self.session_manager.clear_session.return_value = None
-    
-    def query(self, query_text: str, session_id: str = None) -> tuple:
-        """Mock query method"""
-        self.queries_received.append({
-            "query": query_text,
-            "session_id": session_id
-        })
-        
-        if self.should_fail:
-            raise Exception("Mock RAG system error")
-            
-        if self.should_timeout:
-            import time
-            time.sleep(10)  # Simulate timeout
-            
-        return self.query_response, self.query_sources
-    
-    def get_course_analytics(self) -> Dict[str, Any]:
-        """Mock analytics method"""
-        if self.should_fail:
-            raise Exception("Mock analytics error")
-            
-        return self.analytics_data
+
+@pytest.fixture(scope="session")
+def _session_rag():
+    """Single mock rag_system built once and reset between tests"""
+    return make_patched_rag()
+
+
+@pytest.fixture(autouse=True)
+def mock_rag(_session_rag, monkeypatch):
+    """Reset the shared mock and install it as the app's global rag_system"""
+    _session_rag.reset_mock(return_value=True, side_effect=True)
+    monkeypatch.setattr('app.rag_system', _session_rag)
+    return _session_rag
 
 
 class TestAPIEndpoints:
     """Test cases for FastAPI endpoints"""
     
-    def setup_method(self):
-        """Setup for each test method"""
-        self.mock_rag_system = MockRAGSystem()
-        
-        # Replace the global rag_system with our mock
-        with patch('app.rag_system', self.mock_rag_system):
-            self.client = TestClient(app)
-    
-    @patch('app.rag_system')
-    def test_query_endpoint_success(self, mock_rag):
+    def test_query_endpoint_success(self, client, mock_rag):
         """Test successful query to /api/query endpoint"""
         mock_rag.query.return_value = ("Test response", [{"text": "Source 1", "link": "http://example.com"}])
         mock_rag.session_manager.create_session.return_value = "session_123"
         
-        response = self.client.post(
+        response = client.post(
             "/api/query",
             json={
                 "query": "What is Python?",
@@ -90,7 +89,7 @@ class TestAPIEndpoints:
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
         
         assert data["answer"] == "Test response"
         assert len(data["sources"]) == 1
@@ -98,12 +97,11 @@ class TestAPIEndpoints:
         assert data["sources"][0]["link"] == "http://example.com"
         assert data["session_id"] == "session_123"
     
-    @patch('app.rag_system')
-    def test_query_endpoint_with_existing_session(self, mock_rag):
+    def test_query_endpoint_with_existing_session(self, client, mock_rag):
         """Test query with existing session ID"""
         mock_rag.query.return_value = ("Follow-up response", [])
         
-        response = self.client.post(
+        response = client.post(
             "/api/query",
             json={
                 "query": "Follow up question",
@@ -112,7 +110,7 @@ class TestAPIEndpoints:
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
         
         assert data["answer"] == "Follow-up response"
         assert data["session_id"] == "existing_session"
@@ -120,57 +118,65 @@ class TestAPIEndpoints:
         # Verify RAG system was called with the session
         mock_rag.query.assert_called_with("Follow up question", "existing_session")
     
-    @patch('app.rag_system')
-    def test_query_endpoint_rag_system_error(self, mock_rag):
-        """Test query endpoint when RAG system fails"""
-        mock_rag.query.side_effect = Exception("Internal RAG error")
-        
-        response = self.client.post(
+    @pytest.mark.parametrize("exc,status,fragment", [
+        (Exception("Internal RAG error"), 500, "Internal RAG error"),
+        (Exception("credit balance is too low"), 402, "credit balance too low"),
+        (Exception("invalid_request_error: bad parameters"), 400, "API request error"),
+    ], ids=["rag_system_error", "anthropic_credit_error", "invalid_request_error"])
+    def test_query_endpoint_error_mapping(self, client, mock_rag, exc, status, fragment):
+        """Test query endpoint maps RAG system failures to HTTP errors"""
+        mock_rag.query.side_effect = exc
+        
+        response = client.post(
             "/api/query",
-            json={
-                "query": "Test query"
-            }
+            content=_BODY_TEST_QUERY,
+            headers=_JSON_HEADERS
         )
         
-        assert response.status_code == 500
-        data = response.json()
-        assert "Internal RAG error" in data["detail"]
+        assert response.status_code == status
+        data = _json(response)
+        assert fragment in data["detail"]
     
-    @patch('app.rag_system')
-    def test_query_endpoint_anthropic_credit_error(self, mock_rag):
-        """Test query endpoint with Anthropic credit error"""
-        mock_rag.query.side_effect = Exception("credit balance is too low")
+    def test_query_stream_endpoint(self, client, mock_rag, monkeypatch):
+        """Test /api/query/stream sends chunks then sources as server-sent events"""
+        async def query_stream(query_text, session_id):
+            yield {"type": "chunk", "text": "Streamed "}
+            yield {"type": "chunk", "text": "answer"}
+            yield {"type": "done", "sources": [{"text": "Source 1"}]}
+        
+        # A plain attribute would survive reset_mock and leak into later tests
+        monkeypatch.setattr(mock_rag, "query_stream", query_stream)
+        mock_rag.session_manager.create_session.return_value = "session_123"
         
-        response = self.client.post(
-            "/api/query",
-            json={
-                "query": "Test query"
-            }
-        )
+        response = client.post("/api/query/stream", json={"query": "What is Python?"})
         
-        assert response.status_code == 402
-        data = response.json()
-        assert "credit balance too low" in data["detail"]
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        
+        events = [
+            orjson.loads(line[len("data: "):])
+            for line in response.text.split("\n\n") if line.startswith("data: ")
+        ]
+        assert "".join(e["text"] for e in events if e["type"] == "chunk") == "Streamed answer"
+        assert events[-1] == {"type": "done", "sources": [{"text": "Source 1"}], "session_id": "session_123"}
     
-    @patch('app.rag_system')
-    def test_query_endpoint_invalid_request_error(self, mock_rag):
-        """Test query endpoint with invalid request error"""
-        mock_rag.query.side_effect = Exception("invalid_request_error: bad parameters")
+    def test_query_stream_endpoint_error(self, client, mock_rag, monkeypatch):
+        """Test that errors during streaming are reported as an error event"""
+        async def query_stream(query_text, session_id):
+            raise Exception("Internal RAG error")
+            yield  # unreachable; makes this an async generator
         
-        response = self.client.post(
-            "/api/query",
-            json={
-                "query": "Test query"
-            }
-        )
+        monkeypatch.setattr(mock_rag, "query_stream", query_stream)
+        
+        response = client.post("/api/query/stream", content=_BODY_TEST_QUERY, headers=_JSON_HEADERS)
         
-        assert response.status_code == 400
-        data = response.json()
-        assert "API request error" in data["detail"]
+        assert response.status_code == 200
+        assert '"type": "error"' in response.text
+        assert "Internal RAG error" in response.text
     
-    def test_query_endpoint_missing_query(self):
+    def test_query_endpoint_missing_query(self, client):
         """Test query endpoint with missing query parameter"""
-        response = self.client.post(
+        response = client.post(
             "/api/query",
             json={
                 "session_id": "test"
@@ -180,74 +186,68 @@ class TestAPIEndpoints:
         
         assert response.status_code == 422  # Validation error
     
-    def test_query_endpoint_empty_query(self):
+    def test_query_endpoint_empty_query(self, client, mock_rag):
         """Test query endpoint with empty query"""
-        with patch('app.rag_system') as mock_rag:
-            mock_rag.query.return_value = ("Empty query response", [])
-            mock_rag.session_manager.create_session.return_value = "session_123"
-            
-            response = self.client.post(
-                "/api/query",
-                json={
-                    "query": "",
-                    "session_id": None
-                }
-            )
-            
-            assert response.status_code == 200
-            # Should still process empty query
+        mock_rag.query.return_value = ("Empty query response", [])
+        mock_rag.session_manager.create_session.return_value = "session_123"
+        
+        response = client.post(
+            "/api/query",
+            json={
+                "query": "",
+                "session_id": None
+            }
+        )
+        
+        assert response.status_code == 200
+        # Should still process empty query
     
-    @patch('app.rag_system')
-    def test_courses_endpoint_success(self, mock_rag):
+    def test_courses_endpoint_success(self, client, mock_rag):
         """Test successful request to /api/courses endpoint"""
         mock_rag.get_course_analytics.return_value = {
             "total_courses": 5,
             "course_titles": ["Course A", "Course B", "Course C", "Course D", "Course E"]
         }
         
-        response = self.client.get("/api/courses")
+        response = client.get("/api/courses")
         
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
         
         assert data["total_courses"] == 5
         assert len(data["course_titles"]) == 5
         assert "Course A" in data["course_titles"]
     
-    @patch('app.rag_system')
-    def test_courses_endpoint_error(self, mock_rag):
+    def test_courses_endpoint_error(self, client, mock_rag):
         """Test courses endpoint when analytics fails"""
         mock_rag.get_course_analytics.side_effect = Exception("Analytics error")
         
-        response = self.client.get("/api/courses")
+        response = client.get("/api/courses")
         
         assert response.status_code == 500
-        data = response.json()
+        data = _json(response)
         assert "Analytics error" in data["detail"]
     
-    @patch('app.rag_system')
-    def test_courses_endpoint_anthropic_error(self, mock_rag):
+    def test_courses_endpoint_anthropic_error(self, client, mock_rag):
         """Test courses endpoint with Anthropic API error"""
         mock_rag.get_course_analytics.side_effect = Exception("credit balance is too low")
         
-        response = self.client.get("/api/courses")
+        response = client.get("/api/courses")
         
         assert response.status_code == 402
-        data = response.json()
+        data = _json(response)
         assert "credit balance too low" in data["detail"]
     
-    @patch('app.rag_system')
-    def test_clear_session_endpoint_success(self, mock_rag):
+    def test_clear_session_endpoint_success(self, client, mock_rag):
         """Test successful session clearing"""
-        response = self.client.post(
+        response = client.post(
             "/api/clear-session",
-            json={
-                "session_id": "test_session"
-            }
+            content=_BODY_SESSION,
+            headers=_JSON_HEADERS
         )
         
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
         
         assert data["success"] == True
         assert "cleared successfully" in data["message"]
@@ -255,25 +255,23 @@ class TestAPIEndpoints:
         # Verify session manager was called
         mock_rag.session_manager.clear_session.assert_called_with("test_session")
     
-    @patch('app.rag_system')
-    def test_clear_session_endpoint_error(self, mock_rag):
+    def test_clear_session_endpoint_error(self, client, mock_rag):
         """Test session clearing when it fails"""
         mock_rag.session_manager.clear_session.side_effect = Exception("Session error")
         
-        response = self.client.post(
+        response = client.post(
             "/api/clear-session",
-            json={
-                "session_id": "test_session"
-            }
+            content=_BODY_SESSION,
+            headers=_JSON_HEADERS
         )
         
         assert response.status_code == 500
-        data = response.json()
+        data = _json(response)
         assert "Session error" in data["detail"]
     
-    def test_clear_session_endpoint_missing_session_id(self):
+    def test_clear_session_endpoint_missing_session_id(self, client):
         """Test clear session endpoint with missing session_id"""
-        response = self.client.post(
+        response = client.post(
             "/api/clear-session",
             json={}  # Missing session_id
         )
@@ -284,29 +282,24 @@ class TestAPIEndpoints:
 class TestCORSAndMiddleware:
     """Test CORS and middleware functionality"""
     
-    def setup_method(self):
-        """Setup for each test method"""
-        self.client = TestClient(app)
-    
-    def test_cors_headers(self):
+    def test_cors_headers(self, client, mock_rag):
         """Test CORS headers are properly set"""
-        with patch('app.rag_system') as mock_rag:
-            mock_rag.query.return_value = ("Test", [])
-            mock_rag.session_manager.create_session.return_value = "session_123"
-            
-            response = self.client.post(
-                "/api/query",
-                json={"query": "test"},
-                headers={"Origin": "http://localhost:3000"}
-            )
-            
-            assert response.status_code == 200
-            # Should have CORS headers for development
-            assert "access-control-allow-origin" in response.headers
+        mock_rag.query.return_value = ("Test", [])
+        mock_rag.session_manager.create_session.return_value = "session_123"
+        
+        response = client.post(
+            "/api/query",
+            json={"query": "test"},
+            headers={"Origin": "http://localhost:3000"}
+        )
+        
+        assert response.status_code == 200
+        # Should have CORS headers for development
+        assert "access-control-allow-origin" in response.headers
     
-    def test_options_request(self):
+    def test_options_request(self, client):
         """Test preflight OPTIONS request"""
-        response = self.client.options(
+        response = client.options(
             "/api/query",
             headers={
                 "Origin": "http://localhost:3000",
@@ -322,12 +315,7 @@ class TestCORSAndMiddleware:
 class TestResponseFormats:
     """Test response format compliance"""
     
-    def setup_method(self):
-        """Setup for each test method"""
-        self.client = TestClient(app)
-    
-    @patch('app.rag_system')
-    def test_query_response_format(self, mock_rag):
+    def test_query_response_format(self, client, mock_rag):
         """Test that query response matches expected schema"""
         mock_rag.query.return_value = ("Test answer", [
             {"text": "Source 1", "link": "http://example.com"},
@@ -335,94 +323,82 @@ class TestResponseFormats:
         ])
         mock_rag.session_manager.create_session.return_value = "session_123"
         
-        response = self.client.post(
+        response = client.post(
             "/api/query",
-            json={"query": "Test query"}
+            content=_BODY_TEST_QUERY,
+            headers=_JSON_HEADERS
         )
         
         assert response.status_code == 200
-        data = response.json()
-        
-        # Check required fields
-        assert "answer" in data
-        assert "sources" in data
-        assert "session_id" in data
-        
-        # Check data types
-        assert isinstance(data["answer"], str)
-        assert isinstance(data["sources"], list)
-        assert isinstance(data["session_id"], str)
+        # Strict validation against the app's own model checks fields and types in one pass
+        parsed = QueryResponse.model_validate_json(response.content, strict=True)
         
         # Check source format
-        assert len(data["sources"]) == 2
-        assert data["sources"][0]["text"] == "Source 1"
-        assert data["sources"][0]["link"] == "http://example.com"
-        assert data["sources"][1]["text"] == "Source 2"
-        assert "link" not in data["sources"][1] or data["sources"][1]["link"] is None
+        assert parsed.sources == [
+            SourceItem(text="Source 1", link="http://example.com"),
+            SourceItem(text="Source 2"),
+        ]
     
-    @patch('app.rag_system')
-    def test_courses_response_format(self, mock_rag):
+    def test_courses_response_format(self, client, mock_rag):
         """Test that courses response matches expected schema"""
         mock_rag.get_course_analytics.return_value = {
             "total_courses": 3,
             "course_titles": ["Course 1", "Course 2", "Course 3"]
         }
         
-        response = self.client.get("/api/courses")
+        response = client.get("/api/courses")
         
         assert response.status_code == 200
-        data = response.json()
-        
-        # Check required fields
-        assert "total_courses" in data
-        assert "course_titles" in data
-        
-        # Check data types
-        assert isinstance(data["total_courses"], int)
-        assert isinstance(data["course_titles"], list)
+        parsed = CourseStats.model_validate_json(response.content, strict=True)
         
         # Check values
-        assert data["total_courses"] == 3
-        assert len(data["course_titles"]) == 3
+        assert parsed.total_courses == 3
+        assert len(parsed.course_titles) == 3
 
 
+@pytest.mark.skipif(not os.path.isdir(_FRONTEND_DIR), reason="frontend static dir not present")
 class TestStaticFileServing:
     """Test static file serving for frontend"""
     
-    def setup_method(self):
-        """Setup for each test method"""
-        self.client = TestClient(app)
-    
-    def test_root_path_accessibility(self):
+    def test_root_path_accessibility(self, client):
         """Test that root path is accessible (for static files)"""
-        # This tests that the static file mount doesn't crash
-        # The actual file serving depends on the frontend directory existing
-        try:
-            response = self.client.get("/")
-            # Should either serve a file or return 404, but not crash
-            assert response.status_code in [200, 404]
-        except Exception as e:
-            # If static directory doesn't exist, that's expected in tests
-            assert "does not exist" in str(e) or "No such file" in str(e)
+        response = client.get("/")
+        # Should either serve a file or return 404, but not crash
+        assert response.status_code in [200, 404]
+    
+    def test_root_serves_index_with_cache_headers(self, client):
+        """Test that the index page is served explicitly with cache headers"""
+        response = client.get("/")
+        
+        assert response.status_code == 200
+        assert "text/html" in response.headers["content-type"]
+        assert response.headers["cache-control"] == "public, max-age=3600, stale-while-revalidate=86400"
+    
+    def test_static_assets_served_under_static(self, client):
+        """Test that frontend assets are served from /static with validators"""
+        response = client.get("/static/script.js")
+        
+        assert response.status_code == 200
+        assert "etag" in response.headers
+        assert "last-modified" in response.headers
+    
+    def test_unknown_api_path_not_served_as_static(self, client):
+        """Test that API misses return a JSON 404 instead of hitting the file handler"""
+        response = client.get("/api/unknown")
+        
+        assert response.status_code == 404
+        assert _json(response) == {"detail": "Not Found"}
 
 
 class TestErrorScenarios:
     """Test various error scenarios that could cause NetworkError"""
     
-    def setup_method(self):
-        """Setup for each test method"""
-        self.client = TestClient(app)
-    
-    @patch('app.rag_system')
-    def test_large_query(self, mock_rag):
+    def test_large_query(self, client, mock_rag, large_query):
         """Test handling of very large queries"""
         mock_rag.query.return_value = ("Large query response", [])
         mock_rag.session_manager.create_session.return_value = "session_123"
         
-        # Create a very large query
-        large_query = "What is Python? " * 1000
-        
-        response = self.client.post(
+        response = client.post(
             "/api/query",
             json={"query": large_query}
         )
@@ -430,24 +406,22 @@ class TestErrorScenarios:
         # Should handle large queries without crashing
         assert response.status_code in [200, 413, 422]  # Success, payload too large, or validation error
     
-    @patch('app.rag_system')
-    def test_unicode_query(self, mock_rag):
+    def test_unicode_query(self, client, mock_rag, unicode_query):
         """Test handling of unicode characters in queries"""
         mock_rag.query.return_value = ("Unicode response", [])
         mock_rag.session_manager.create_session.return_value = "session_123"
         
-        response = self.client.post(
+        response = client.post(
             "/api/query",
-            json={"query": "What is Python? 中文 émojis 🐍"}
+            json={"query": unicode_query}
         )
         
         assert response.status_code == 200
         # Should handle unicode without issues
     
-    @patch('app.rag_system')
-    def test_malformed_json(self, mock_rag):
+    def test_malformed_json(self, client, mock_rag):
         """Test handling of malformed JSON requests"""
-        response = self.client.post(
+        response = client.post(
             "/api/query",
             data="malformed json",
             headers={"content-type": "application/json"}
@@ -455,25 +429,59 @@ class TestErrorScenarios:
         
         assert response.status_code == 422  # Should return validation error
     
-    @patch('app.rag_system')
-    def test_timeout_simulation(self, mock_rag):
+    def test_timeout_simulation(self, client, mock_rag, monkeypatch):
         """Test behavior with simulated timeout"""
-        # Mock a slow response
+        # Record requested delays instead of blocking the suite
+        sleeps = []
+        monkeypatch.setattr(time, "sleep", sleeps.append)
+        
         def slow_query(*args, **kwargs):
-            import time
-            time.sleep(0.1)  # Short delay for testing
+            time.sleep(0.1)
             return ("Delayed response", [])
             
         mock_rag.query.side_effect = slow_query
         mock_rag.session_manager.create_session.return_value = "session_123"
         
-        response = self.client.post(
+        response = client.post(
+            "/api/query",
+            content=_BODY_SLOW_QUERY,
+            headers=_JSON_HEADERS
+        )
+        
+        # Should complete successfully and have taken the slow path
+        assert response.status_code == 200
+        assert sleeps == [0.1]
+    
+    def test_rag_system_timeout(self, client, make_mock_rag, monkeypatch):
+        """Test that a timed-out RAG query surfaces as a server error without stalling"""
+        rag = make_mock_rag(should_timeout=True)
+        monkeypatch.setattr('app.rag_system', rag)
+        
+        response = client.post(
             "/api/query",
-            json={"query": "Slow query"}
+            content=_BODY_SLOW_QUERY,
+            headers=_JSON_HEADERS
         )
         
-        # Should complete successfully even with delay
+        assert response.status_code == 500
+        assert "mock timeout" in _json(response)["detail"]
+        rag.session_manager.create_session.assert_called_once_with()
+    
+    def test_rag_system_recovers_after_failure(self, client, make_mock_rag, monkeypatch):
+        """Test that a failed query leaves the endpoint able to answer the next one"""
+        failing_rag = make_mock_rag(should_fail=True)
+        rag = make_mock_rag(query_response="Recovered answer", query_sources=[])
+        
+        monkeypatch.setattr('app.rag_system', failing_rag)
+        response = client.post("/api/query", content=_BODY_TEST_QUERY, headers=_JSON_HEADERS)
+        assert response.status_code == 500
+        
+        monkeypatch.setattr('app.rag_system', rag)
+        response = client.post("/api/query", content=_BODY_TEST_QUERY, headers=_JSON_HEADERS)
+        
         assert response.status_code == 200
+        assert _json(response)["answer"] == "Recovered answer"
+        assert rag.queries_received == [{"query": "Test query", "session_id": "test_session_123"}]
 
 
 if __name__ == "__main__":
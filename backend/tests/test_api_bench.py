@@ -0,0 +1,40 @@
+"""
+Benchmarks for the FastAPI query endpoint.
+
+Runs with the rest of the suite; use `pytest backend/tests/test_api_bench.py
+--benchmark-only --benchmark-columns=min,mean,median` to compare against a
+saved baseline.
+"""
+
+import pytest
+
+from app import app
+
+from .asgi_client import ASGIClient
+from .test_api import make_patched_rag
+
+
+@pytest.fixture(scope="module")
+def client():
+    """ASGI client shared by the benchmarks in this module"""
+    c = ASGIClient(app)
+    yield c
+    c.close()
+
+
+@pytest.fixture
+def mock_rag(monkeypatch):
+    """Replace the app's global rag_system with a fresh mock"""
+    rag = make_patched_rag()
+    monkeypatch.setattr('app.rag_system', rag)
+    return rag
+
+
+def test_query_bench(benchmark, client, mock_rag):
+    """Round-trip cost of /api/query with the RAG system mocked out"""
+    mock_rag.query.return_value = ("x", [])
+    mock_rag.session_manager.create_session.return_value = "bench_session"
+    
+    response = benchmark(client.post, "/api/query", json={"query": "x"})
+    
+    assert response.status_code == 200
@@ -5,18 +5,23 @@ This module tests all FastAPI endpoints with proper mocking and fixtures
 to avoid static file mounting issues in the test environment.
 """
 
+import asyncio
+import httpx
 import pytest
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.testclient import TestClient
-from unittest.mock import Mock, patch
-import json
+from fastapi.responses import ORJSONResponse
+import orjson
 import time
 
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from .asgi_client import ASGIClient
+
+
+def _json(response):
+    """Decode a response body once with orjson"""
+    return orjson.loads(response.content)
+
 
 # Define the Pydantic models here to avoid importing from app
 from pydantic import BaseModel
@@ -48,49 +53,145 @@ class CourseStats(BaseModel):
     course_titles: List[str]
 
 
-def create_test_app():
+class _StubMethod:
+    """Callable stand-in that logs calls and returns or raises like a Mock method"""
+
+    __slots__ = ("name", "calls", "return_value", "side_effect")
+
+    def __init__(self, name: str, calls: list, return_value=None):
+        self.name = name
+        self.calls = calls
+        self.return_value = return_value
+        self.side_effect = None
+
+    def __call__(self, *args):
+        self.calls.append((self.name, args))
+        if self.side_effect is not None:
+            if isinstance(self.side_effect, BaseException):
+                raise self.side_effect
+            return self.side_effect(*args)
+        return self.return_value
+
+
+class StubSessionManager:
+    """Session manager stub exposing only what the routes use"""
+
+    __slots__ = ("create_session", "clear_session")
+
+    def __init__(self, calls: list):
+        self.create_session = _StubMethod("create_session", calls, "test_session_123")
+        self.clear_session = _StubMethod("clear_session", calls)
+
+
+class StubRag:
+    """Hand-rolled RAG system stub; every call is appended to `calls` as (name, args)"""
+
+    __slots__ = ("query", "session_manager", "get_course_analytics", "calls")
+
+    def __init__(self):
+        self.calls = []
+        self.query = _StubMethod(
+            "query", self.calls, ("Default test response", [{"text": "Test source"}])
+        )
+        self.session_manager = StubSessionManager(self.calls)
+        self.get_course_analytics = _StubMethod("get_course_analytics", self.calls, {
+            "total_courses": 3,
+            "course_titles": ["Course 1", "Course 2", "Course 3"]
+        })
+
+
+# Pre-serialized bodies for payloads that are posted repeatedly
+_JSON_HEADERS = {"content-type": "application/json"}
+_BODY_CONCURRENT = orjson.dumps({"query": "Concurrent test"})
+_BODY_SIMPLE = orjson.dumps({"query": "test"})
+_BODY_TEST_QUERY = orjson.dumps({"query": "Test query"})
+
+
+# (substring, builder taking the error message) checked in order; each match
+# builds a new exception so raised instances never share a traceback
+_ERROR_RULES = (
+    ("credit balance is too low", lambda msg: HTTPException(
+        status_code=402,
+        detail="Anthropic API credit balance too low. Please add credits to your account."
+    )),
+    ("invalid_request_error", lambda msg: HTTPException(status_code=400, detail=f"API request error: {msg}")),
+)
+
+
+def _map_error(e: Exception) -> HTTPException:
+    """Map a RAG system exception to the HTTPException the real app would raise"""
+    error_msg = str(e)
+    for pattern, build in _ERROR_RULES:
+        if pattern in error_msg:
+            return build(error_msg)
+    return HTTPException(status_code=500, detail=error_msg)
+
+
+class HealthShortCircuit:
+    """Pure ASGI middleware answering GET /health with a fixed body before routing"""
+
+    _BODY = orjson.dumps({"status": "healthy", "service": "rag-system"})
+    _HEADERS = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(_BODY)).encode()),
+    ]
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/health":
+            await send({"type": "http.response.start", "status": 200, "headers": self._HEADERS})
+            await send({"type": "http.response.body", "body": self._BODY})
+            return
+        await self.app(scope, receive, send)
+
+
+def create_test_app(enable_cors: bool = False, enable_trusted_host: bool = False):
     """
     Create a test FastAPI app without static file mounting.
 
     This avoids issues with missing frontend directory in test environment.
+    Middleware is opt-in so tests that don't exercise it skip its dispatch cost.
     """
-    from fastapi import HTTPException, Request
+    from fastapi import Request
     from pydantic import BaseModel
     from typing import List, Optional, Union
-    import time
 
-    app = FastAPI(title="Course Materials RAG System (Test)", root_path="")
+    app = FastAPI(title="Course Materials RAG System (Test)", root_path="",
+                  default_response_class=ORJSONResponse)
 
-    # Add request logging middleware for debugging
-    @app.middleware("http")
-    async def log_requests(request: Request, call_next):
-        start_time = time.time()
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        return response
+    # Added first so it sits innermost: /health still passes through any enabled
+    # middleware but skips routing and serialization
+    app.add_middleware(HealthShortCircuit)
 
     # Add trusted host middleware
-    app.add_middleware(
-        TrustedHostMiddleware,
-        allowed_hosts=["*"]
-    )
+    if enable_trusted_host:
+        app.add_middleware(
+            TrustedHostMiddleware,
+            allowed_hosts=["*"]
+        )
 
     # Enable CORS
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=["*"],
-        allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
-        expose_headers=["*"],
-    )
-
-    # Mock RAG system for testing
-    mock_rag_system = Mock()
-
-    @app.post("/api/query", response_model=QueryResponse)
-    async def query_documents(request: QueryRequest):
+    if enable_cors:
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+            expose_headers=["*"],
+        )
+
+    # Mock RAG system for testing; swapped per test via app.state
+    app.state.mock_rag = StubRag()
+
+    # Handlers return the response directly so no response_model validation runs;
+    # TestResponseValidation still checks the payloads against the models client-side
+    @app.post("/api/query")
+    async def query_documents(request: QueryRequest, http_request: Request):
         """Process a query and return response with sources"""
+        mock_rag_system = http_request.app.state.mock_rag
         try:
             session_id = request.session_id
             if not session_id:
@@ -98,82 +199,71 @@ def create_test_app():
 
             answer, sources = mock_rag_system.query(request.query, session_id)
 
-            return QueryResponse(
-                answer=answer,
-                sources=sources,
-                session_id=session_id
-            )
+            return ORJSONResponse({
+                "answer": answer,
+                "sources": sources,
+                "session_id": session_id
+            })
         except Exception as e:
-            error_msg = str(e)
-            if "credit balance is too low" in error_msg:
-                raise HTTPException(
-                    status_code=402,
-                    detail="Anthropic API credit balance too low. Please add credits to your account."
-                )
-            elif "invalid_request_error" in error_msg:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"API request error: {error_msg}"
-                )
-            else:
-                raise HTTPException(status_code=500, detail=error_msg)
-
-    @app.get("/api/courses", response_model=CourseStats)
-    async def get_course_stats():
+            raise _map_error(e)
+
+    @app.get("/api/courses")
+    async def get_course_stats(http_request: Request):
         """Get course analytics and statistics"""
+        mock_rag_system = http_request.app.state.mock_rag
         try:
-            analytics = mock_rag_system.get_course_analytics()
-            return CourseStats(
-                total_courses=analytics["total_courses"],
-                course_titles=analytics["course_titles"]
-            )
+            return ORJSONResponse(mock_rag_system.get_course_analytics())
         except Exception as e:
-            error_msg = str(e)
-            if "credit balance is too low" in error_msg:
-                raise HTTPException(
-                    status_code=402,
-                    detail="Anthropic API credit balance too low. Please add credits to your account."
-                )
-            elif "invalid_request_error" in error_msg:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"API request error: {error_msg}"
-                )
-            else:
-                raise HTTPException(status_code=500, detail=error_msg)
+            raise _map_error(e)
 
     @app.post("/api/clear-session")
-    async def clear_session(request: ClearSessionRequest):
+    async def clear_session(request: ClearSessionRequest, http_request: Request):
         """Clear a conversation session"""
+        mock_rag_system = http_request.app.state.mock_rag
         try:
             mock_rag_system.session_manager.clear_session(request.session_id)
             return {"success": True, "message": "Session cleared successfully"}
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
-    @app.get("/health")
-    async def health_check():
-        """Health check endpoint"""
-        return {"status": "healthy", "service": "rag-system"}
+    return app
+
+
+@pytest.fixture(scope="session")
+def _test_app():
+    """Build the test app and its client once; routes read the mock from app.state."""
+    app = create_test_app()
+    client = ASGIClient(app)
+    yield app, client
+    client.close()
 
-    return app, mock_rag_system
+
+@pytest.fixture(scope="session")
+def _cors_test_app():
+    """Test app with CORS and trusted host middleware, built once."""
+    app = create_test_app(enable_cors=True, enable_trusted_host=True)
+    client = ASGIClient(app)
+    yield app, client
+    client.close()
+
+
+def _install_stub(app_and_client):
+    app, client = app_and_client
+    mock_rag = StubRag()
+    app.state.mock_rag = mock_rag
+    return client, mock_rag
 
 
 @pytest.fixture
-def test_app_client():
+def test_app_client(_test_app):
     """Fixture providing a test FastAPI client with mocked dependencies."""
-    app, mock_rag = create_test_app()
-    client = TestClient(app)
+    return _install_stub(_test_app)
 
-    # Configure mock defaults
-    mock_rag.query.return_value = ("Default test response", [{"text": "Test source"}])
-    mock_rag.session_manager.create_session.return_value = "test_session_123"
-    mock_rag.get_course_analytics.return_value = {
-        "total_courses": 3,
-        "course_titles": ["Course 1", "Course 2", "Course 3"]
-    }
 
-    return client, mock_rag
+@pytest.fixture
+def cors_app_client(_cors_test_app):
+    """Like test_app_client, but the app runs the CORS and trusted host middleware."""
+    return _install_stub(_cors_test_app)
 
 
 @pytest.mark.api
@@ -195,7 +285,7 @@ class TestQueryEndpoint:
         )
 
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
 
         assert data["answer"] == "Python is a programming language"
         assert len(data["sources"]) == 1
@@ -204,7 +294,10 @@ class TestQueryEndpoint:
         assert data["session_id"] == "new_session_456"
 
         # Verify RAG system was called correctly
-        mock_rag.query.assert_called_once_with("What is Python?", "new_session_456")
+        assert mock_rag.calls == [
+            ("create_session", ()),
+            ("query", ("What is Python?", "new_session_456")),
+        ]
 
     def test_query_success_with_existing_session(self, test_app_client):
         """Test successful query with existing session"""
@@ -218,14 +311,13 @@ class TestQueryEndpoint:
         )
 
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
 
         assert data["answer"] == "Follow-up answer"
         assert data["session_id"] == "existing_session"
 
         # Verify session creation was not called
-        mock_rag.session_manager.create_session.assert_not_called()
-        mock_rag.query.assert_called_once_with("Tell me more", "existing_session")
+        assert mock_rag.calls == [("query", ("Tell me more", "existing_session"))]
 
     def test_query_with_complex_sources(self, test_app_client):
         """Test query response with complex source structures"""
@@ -244,7 +336,7 @@ class TestQueryEndpoint:
         )
 
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
 
         assert len(data["sources"]) == 3
         assert data["sources"][0]["text"] == "Source with link"
@@ -252,50 +344,22 @@ class TestQueryEndpoint:
         assert data["sources"][1]["text"] == "Source without link"
         assert data["sources"][2] == "Plain string source"
 
-    def test_query_anthropic_credit_error(self, test_app_client, api_error_scenarios):
-        """Test query endpoint with Anthropic credit error"""
-        client, mock_rag = test_app_client
-
-        error_scenario = api_error_scenarios["credit_low"]
-        mock_rag.query.side_effect = error_scenario["exception"]
-
-        response = client.post(
-            "/api/query",
-            json={"query": "Test query"}
-        )
-
-        assert response.status_code == error_scenario["status_code"]
-        assert error_scenario["message_contains"] in response.json()["detail"]
-
-    def test_query_invalid_request_error(self, test_app_client, api_error_scenarios):
-        """Test query endpoint with invalid request error"""
+    @pytest.mark.parametrize("scenario_key", ["credit_low", "invalid_request", "generic_error"])
+    def test_query_error_scenarios(self, test_app_client, api_error_scenarios, scenario_key):
+        """Test query endpoint maps RAG system errors to the expected HTTP status"""
         client, mock_rag = test_app_client
 
-        error_scenario = api_error_scenarios["invalid_request"]
+        error_scenario = api_error_scenarios[scenario_key]
         mock_rag.query.side_effect = error_scenario["exception"]
 
         response = client.post(
             "/api/query",
-            json={"query": "Test query"}
+            content=_BODY_TEST_QUERY,
+            headers=_JSON_HEADERS
         )
 
         assert response.status_code == error_scenario["status_code"]
-        assert error_scenario["message_contains"] in response.json()["detail"]
-
-    def test_query_generic_error(self, test_app_client, api_error_scenarios):
-        """Test query endpoint with generic error"""
-        client, mock_rag = test_app_client
-
-        error_scenario = api_error_scenarios["generic_error"]
-        mock_rag.query.side_effect = error_scenario["exception"]
-
-        response = client.post(
-            "/api/query",
-            json={"query": "Test query"}
-        )
-
-        assert response.status_code == error_scenario["status_code"]
-        assert error_scenario["message_contains"] in response.json()["detail"]
+        assert error_scenario["message_contains"] in _json(response)["detail"]
 
     def test_query_missing_required_field(self, test_app_client):
         """Test query endpoint with missing query field"""
@@ -322,21 +386,30 @@ class TestQueryEndpoint:
         assert response.status_code == 200
         # Should still process empty query
 
-    def test_query_unicode_handling(self, test_app_client, query_test_data):
-        """Test query endpoint handles unicode properly"""
+    def test_query_scenarios(self, test_app_client, query_scenario):
+        """Test query endpoint across the shared query scenarios, including unicode"""
         client, mock_rag = test_app_client
 
-        unicode_data = query_test_data["unicode_query"]
-        mock_rag.query.return_value = (unicode_data["expected_answer"], [])
+        mock_rag.query.return_value = (
+            query_scenario["expected_answer"],
+            query_scenario["expected_sources"]
+        )
 
         response = client.post(
             "/api/query",
-            json={"query": unicode_data["query"]}
+            json={"query": query_scenario["query"]}
         )
 
         assert response.status_code == 200
-        # Verify unicode was handled properly
-        mock_rag.query.assert_called()
+        data = _json(response)
+        assert data["answer"] == query_scenario["expected_answer"]
+        assert [source["text"] for source in data["sources"]] == [
+            source["text"] for source in query_scenario["expected_sources"]
+        ]
+        assert mock_rag.calls == [
+            ("create_session", ()),
+            ("query", (query_scenario["query"], "test_session_123")),
+        ]
 
 
 @pytest.mark.api
@@ -356,7 +429,7 @@ class TestCoursesEndpoint:
         response = client.get("/api/courses")
 
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
 
         assert data["total_courses"] == 5
         assert len(data["course_titles"]) == 5
@@ -375,33 +448,23 @@ class TestCoursesEndpoint:
         response = client.get("/api/courses")
 
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
 
         assert data["total_courses"] == 0
         assert len(data["course_titles"]) == 0
 
-    def test_courses_anthropic_error(self, test_app_client, api_error_scenarios):
-        """Test courses endpoint with Anthropic API error"""
+    @pytest.mark.parametrize("scenario_key", ["credit_low", "invalid_request", "generic_error"])
+    def test_courses_error_scenarios(self, test_app_client, api_error_scenarios, scenario_key):
+        """Test courses endpoint maps analytics errors to the expected HTTP status"""
         client, mock_rag = test_app_client
 
-        error_scenario = api_error_scenarios["credit_low"]
+        error_scenario = api_error_scenarios[scenario_key]
         mock_rag.get_course_analytics.side_effect = error_scenario["exception"]
 
         response = client.get("/api/courses")
 
         assert response.status_code == error_scenario["status_code"]
-        assert error_scenario["message_contains"] in response.json()["detail"]
-
-    def test_courses_generic_error(self, test_app_client):
-        """Test courses endpoint with generic error"""
-        client, mock_rag = test_app_client
-
-        mock_rag.get_course_analytics.side_effect = Exception("Database error")
-
-        response = client.get("/api/courses")
-
-        assert response.status_code == 500
-        assert "Database error" in response.json()["detail"]
+        assert error_scenario["message_contains"] in _json(response)["detail"]
 
 
 @pytest.mark.api
@@ -418,13 +481,13 @@ class TestClearSessionEndpoint:
         )
 
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
 
         assert data["success"] is True
         assert "cleared successfully" in data["message"]
 
         # Verify session manager was called
-        mock_rag.session_manager.clear_session.assert_called_with("test_session_to_clear")
+        assert mock_rag.calls[-1] == ("clear_session", ("test_session_to_clear",))
 
     def test_clear_session_error(self, test_app_client):
         """Test session clearing with error"""
@@ -438,7 +501,7 @@ class TestClearSessionEndpoint:
         )
 
         assert response.status_code == 500
-        assert "Session not found" in response.json()["detail"]
+        assert "Session not found" in _json(response)["detail"]
 
     def test_clear_session_missing_session_id(self, test_app_client):
         """Test clear session endpoint with missing session_id"""
@@ -468,23 +531,23 @@ class TestClearSessionEndpoint:
 class TestCORSAndMiddleware:
     """Test CORS and middleware functionality"""
 
-    def test_cors_headers_present(self, test_app_client):
+    def test_cors_headers_present(self, cors_app_client):
         """Test that CORS headers are properly set"""
-        client, mock_rag = test_app_client
+        client, mock_rag = cors_app_client
 
         response = client.post(
             "/api/query",
-            json={"query": "test"},
-            headers={"Origin": "http://localhost:3000"}
+            content=_BODY_SIMPLE,
+            headers={**_JSON_HEADERS, "Origin": "http://localhost:3000"}
         )
 
         assert response.status_code == 200
         # Check for CORS headers
         assert "access-control-allow-origin" in response.headers
 
-    def test_preflight_options_request(self, test_app_client):
+    def test_preflight_options_request(self, cors_app_client):
         """Test preflight OPTIONS request handling"""
-        client, mock_rag = test_app_client
+        client, mock_rag = cors_app_client
 
         response = client.options(
             "/api/query",
@@ -498,9 +561,9 @@ class TestCORSAndMiddleware:
         # Should handle preflight request
         assert response.status_code in [200, 204]
 
-    def test_trusted_host_middleware(self, test_app_client):
+    def test_trusted_host_middleware(self, cors_app_client):
         """Test that trusted host middleware is working"""
-        client, mock_rag = test_app_client
+        client, mock_rag = cors_app_client
 
         response = client.get("/health")
 
@@ -523,11 +586,12 @@ class TestResponseValidation:
 
         response = client.post(
             "/api/query",
-            json={"query": "Test query"}
+            content=_BODY_TEST_QUERY,
+            headers=_JSON_HEADERS
         )
 
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
 
         # Validate schema compliance
         query_response = QueryResponse(**data)
@@ -542,7 +606,7 @@ class TestResponseValidation:
         response = client.get("/api/courses")
 
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
 
         # Validate schema compliance
         course_stats = CourseStats(**data)
@@ -585,30 +649,19 @@ class TestErrorHandling:
 
     def test_concurrent_requests(self, test_app_client):
         """Test handling of concurrent requests to the API"""
-        import threading
-
         client, mock_rag = test_app_client
         mock_rag.query.return_value = ("Concurrent response", [])
 
-        responses = []
-
-        def make_request():
-            response = client.post(
-                "/api/query",
-                json={"query": "Concurrent test"}
-            )
-            responses.append(response)
+        async def run_requests():
+            # Dispatch straight into the app on one event loop instead of via threads
+            transport = httpx.ASGITransport(app=client.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as ac:
+                return await asyncio.gather(*[
+                    ac.post("/api/query", content=_BODY_CONCURRENT, headers=_JSON_HEADERS)
+                    for _ in range(5)
+                ])
 
-        # Create multiple threads to simulate concurrent requests
-        threads = []
-        for _ in range(5):
-            thread = threading.Thread(target=make_request)
-            threads.append(thread)
-            thread.start()
-
-        # Wait for all threads to complete
-        for thread in threads:
-            thread.join()
+        responses = asyncio.run(run_requests())
 
         # All requests should succeed
         assert len(responses) == 5
@@ -621,26 +674,28 @@ class TestErrorHandling:
 class TestPerformanceScenarios:
     """Test performance-related scenarios (marked as slow tests)"""
 
-    def test_timeout_simulation(self, test_app_client):
+    def test_timeout_simulation(self, test_app_client, monkeypatch):
         """Test behavior with simulated slow responses"""
         client, mock_rag = test_app_client
 
+        # Record requested delays instead of blocking the suite
+        sleeps = []
+        monkeypatch.setattr(time, "sleep", sleeps.append)
+
         def slow_query(*args, **kwargs):
-            time.sleep(0.1)  # Short delay for testing
+            time.sleep(0.1)
             return ("Delayed response", [])
 
         mock_rag.query.side_effect = slow_query
 
-        start_time = time.time()
         response = client.post(
             "/api/query",
             json={"query": "Slow query"}
         )
-        end_time = time.time()
 
-        # Should complete successfully even with delay
+        # Should complete successfully and have taken the slow path
         assert response.status_code == 200
-        assert end_time - start_time >= 0.1  # Verify delay occurred
+        assert sleeps == [0.1]
 
 
 if __name__ == "__main__":
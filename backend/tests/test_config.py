@@ -12,10 +12,6 @@ from unittest.mock import patch, mock_open
 from dataclasses import dataclass
 
 # Import the configuration module
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from config import Config, config
 
 
@@ -34,6 +30,9 @@ class TestConfig:
         assert test_config.MAX_RESULTS == 5
         assert test_config.MAX_HISTORY == 2
         assert test_config.CHROMA_PATH == "./chroma_db"
+        assert test_config.RESPONSE_CACHE_THRESHOLD == 0.95
+        assert test_config.RESPONSE_CACHE_TTL == 3600
+        assert test_config.ANTHROPIC_CONCURRENCY == 10
     
     def test_config_is_dataclass(self):
         """Test that Config is properly defined as dataclass"""
@@ -5,6 +5,7 @@ These tests help diagnose how the RAG system handles content-query related
 questions and identify potential NetworkError sources.
 """
 
+import asyncio
 import pytest
 from unittest.mock import Mock, MagicMock, patch
 from typing import List, Dict, Any, Optional, Tuple
@@ -12,11 +13,8 @@ import os
 import tempfile
 
 # Import the classes we're testing
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from rag_system import RAGSystem
+from ai_generator import ResponseGenerationError
 from models import Course, Lesson, CourseChunk
 from config import Config
 
@@ -32,7 +30,10 @@ class MockConfig:
         self.MAX_RESULTS = 5
         self.ANTHROPIC_API_KEY = "fake-api-key"
         self.ANTHROPIC_MODEL = "claude-sonnet-4"
+        self.ANTHROPIC_CONCURRENCY = 10
         self.MAX_HISTORY = 2
+        self.RESPONSE_CACHE_THRESHOLD = 0.95
+        self.RESPONSE_CACHE_TTL = 3600
 
 
 class MockDocumentProcessor:
@@ -122,9 +123,10 @@ class MockAIGenerator:
         self.should_use_tools = False
         self.last_query = None
         self.last_tools = None
+        self.stream_error = None  # Raised after the streamed words when set
         
-    def generate_response(self, query: str, conversation_history=None, 
-                         tools=None, tool_manager=None) -> str:
+    async def generate_response(self, query: str, conversation_history=None, 
+                               tools=None, tool_manager=None) -> str:
         """Mock response generation"""
         self.last_query = query
         self.last_tools = tools
@@ -138,6 +140,15 @@ class MockAIGenerator:
             return f"Based on search results: {tool_result}"
             
         return self.response_text
+    
+    async def stream_response(self, query: str, conversation_history=None,
+                              tools=None, tool_manager=None):
+        """Mock streamed response generation - yields the response word by word"""
+        response = await self.generate_response(query, conversation_history, tools, tool_manager)
+        for word in response.split(" "):
+            yield word + " "
+        if self.stream_error:
+            raise self.stream_error
 
 
 class MockSessionManager:
@@ -167,6 +178,34 @@ class MockSessionManager:
         self.sessions[session_id].append(f"Assistant: {response}")
 
 
+class MockResponseCache:
+    """Mock semantic response cache for testing"""
+    
+    def __init__(self):
+        self.entries = {}
+        self.cleared = False
+        
+    def embed_query(self, query: str):
+        """Mock query embedding"""
+        return [float(len(query))]
+        
+    def lookup(self, query: str, conversation_history: Optional[str] = None, query_embedding=None):
+        """Mock cache lookup - exact matches only"""
+        self.last_lookup_embedding = query_embedding
+        return self.entries.get((query, conversation_history))
+        
+    def store(self, query: str, conversation_history: Optional[str], answer: str, sources: List,
+              query_embedding=None):
+        """Mock cache store"""
+        self.last_store_embedding = query_embedding
+        self.entries[(query, conversation_history)] = (answer, sources)
+        
+    def clear(self):
+        """Mock cache clear"""
+        self.entries = {}
+        self.cleared = True
+
+
 class MockToolManager:
     """Mock tool manager for testing"""
     
@@ -195,6 +234,28 @@ class MockToolManager:
     def reset_sources(self):
         """Mock resetting sources"""
         self.last_sources = []
+        
+    def for_request(self):
+        """Hand the staged sources to a single request, as the real per-request view would"""
+        sources, self.last_sources = self.last_sources, []
+        return MockRequestTools(self, sources)
+
+
+class MockRequestTools:
+    """Mock per-request tool manager view"""
+    
+    def __init__(self, manager: MockToolManager, sources: List):
+        self.manager = manager
+        self.sources = sources
+        
+    def get_tool_definitions(self):
+        return self.manager.get_tool_definitions()
+        
+    def execute_tool(self, tool_name: str, **kwargs) -> str:
+        return self.manager.execute_tool(tool_name, **kwargs)
+        
+    def get_sources(self) -> List:
+        return self.sources
 
 
 class TestRAGSystem:
@@ -225,6 +286,7 @@ class TestRAGSystem:
             self.config.MAX_HISTORY
         )
         self.rag_system.tool_manager = MockToolManager()
+        self.rag_system.response_cache = MockResponseCache()
     
     def test_initialization(self):
         """Test RAGSystem initialization"""
@@ -249,6 +311,9 @@ class TestRAGSystem:
             
             # Verify course was added to vector store
             assert "Test Course" in self.rag_system.vector_store.courses
+            
+            # Cached answers from before the course existed are dropped
+            assert self.rag_system.response_cache.cleared
     
     def test_add_course_document_failure(self):
         """Test handling of document processing failure"""
@@ -275,16 +340,28 @@ class TestRAGSystem:
             assert courses == 3
             assert chunks == 6  # 2 chunks per course
     
+    def test_add_course_folder_invalidates_response_cache(self):
+        """Test that adding new courses without a rebuild drops cached answers"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, 'course1.txt'), 'w') as f:
+                f.write("Test content")
+            
+            courses, _ = self.rag_system.add_course_folder(temp_dir, clear_existing=False)
+        
+        assert courses == 1
+        assert self.rag_system.response_cache.cleared
+    
     def test_add_course_folder_nonexistent(self):
         """Test adding from nonexistent folder"""
         courses, chunks = self.rag_system.add_course_folder("/nonexistent/path")
         
         assert courses == 0
         assert chunks == 0
+        assert not self.rag_system.response_cache.cleared
     
     def test_query_simple(self):
         """Test simple query processing"""
-        response, sources = self.rag_system.query("What is Python?")
+        response, sources = asyncio.run(self.rag_system.query("What is Python?"))
         
         assert response == "This is a mock AI response"
         assert isinstance(sources, list)
@@ -298,10 +375,10 @@ class TestRAGSystem:
         session_id = "test_session"
         self.rag_system.session_manager.sessions[session_id] = ["Previous context"]
         
-        response, sources = self.rag_system.query(
+        response, sources = asyncio.run(self.rag_system.query(
             "Follow up question", 
             session_id=session_id
-        )
+        ))
         
         assert response == "This is a mock AI response"
         
@@ -312,7 +389,7 @@ class TestRAGSystem:
         """Test query that triggers tool usage"""
         self.rag_system.ai_generator.should_use_tools = True
         
-        response, sources = self.rag_system.query("Search for course content")
+        response, sources = asyncio.run(self.rag_system.query("Search for course content"))
         
         assert "Based on search results:" in response
         assert "Mock search result content" in response
@@ -326,10 +403,70 @@ class TestRAGSystem:
         self.rag_system.ai_generator.should_fail = True
         
         with pytest.raises(Exception) as excinfo:
-            self.rag_system.query("test query")
+            asyncio.run(self.rag_system.query("test query"))
         
         assert "Mock AI generation error" in str(excinfo.value)
     
+    def test_query_cache_hit_skips_generation(self):
+        """Test that a cached answer is returned without calling the AI"""
+        self.rag_system.response_cache.store(
+            "What is Python?", None, "Cached answer", [{"text": "Cached source"}]
+        )
+        
+        response, sources = asyncio.run(self.rag_system.query("What is Python?"))
+        
+        assert response == "Cached answer"
+        assert sources == [{"text": "Cached source"}]
+        assert self.rag_system.ai_generator.last_query is None
+    
+    def test_query_stream(self):
+        """Test streamed query yields chunks, then sources, and records the exchange"""
+        self.rag_system.tool_manager.last_sources = [{"text": "Course 1 - Lesson 1"}]
+        session_id = self.rag_system.session_manager.create_session()
+        
+        async def collect():
+            return [event async for event in self.rag_system.query_stream("What is Python?", session_id)]
+        
+        events = asyncio.run(collect())
+        
+        chunks = [event["text"] for event in events if event["type"] == "chunk"]
+        assert "".join(chunks).strip() == "This is a mock AI response"
+        assert events[-1] == {"type": "done", "sources": [{"text": "Course 1 - Lesson 1"}]}
+        assert self.rag_system.tool_manager.last_sources == []
+        assert ("What is Python?", "") in self.rag_system.response_cache.entries
+        
+        history = self.rag_system.session_manager.get_conversation_history(session_id)
+        assert "What is Python?" in history
+    
+    def test_query_stream_error_midway(self):
+        """Test that a stream failing partway ends with an error event and is not kept"""
+        self.rag_system.ai_generator.stream_error = ResponseGenerationError("Error generating response: overloaded")
+        session_id = self.rag_system.session_manager.create_session()
+        
+        async def collect():
+            return [event async for event in self.rag_system.query_stream("What is Python?", session_id)]
+        
+        events = asyncio.run(collect())
+        
+        assert events[0]["type"] == "chunk"
+        assert events[-1] == {"type": "error", "detail": "Error generating response: overloaded"}
+        assert not any(event["type"] == "done" for event in events)
+        assert ("What is Python?", "") not in self.rag_system.response_cache.entries
+        assert self.rag_system.session_manager.get_conversation_history(session_id) == ""
+    
+    def test_query_stores_response_in_cache(self):
+        """Test that generated answers are cached but errors are not"""
+        asyncio.run(self.rag_system.query("What is Python?"))
+        assert ("What is Python?", None) in self.rag_system.response_cache.entries
+        
+        # The query is embedded once and shared by the lookup and the store
+        assert self.rag_system.response_cache.last_lookup_embedding == [15.0]
+        assert self.rag_system.response_cache.last_store_embedding == [15.0]
+        
+        self.rag_system.ai_generator.response_text = "Error generating response: API down"
+        asyncio.run(self.rag_system.query("Another question"))
+        assert ("Another question", None) not in self.rag_system.response_cache.entries
+    
     def test_get_course_analytics(self):
         """Test course analytics functionality"""
         # Add some test courses
@@ -350,7 +487,7 @@ class TestRAGSystem:
             {"text": "Course 1 - Lesson 1", "link": "https://example.com"}
         ]
         
-        response, sources = self.rag_system.query("test query")
+        response, sources = asyncio.run(self.rag_system.query("test query"))
         
         # Sources should be returned
         assert len(sources) == 1
@@ -386,6 +523,7 @@ class TestRAGSystemIntegration:
         self.rag_system.session_manager = MockSessionManager(
             self.config.MAX_HISTORY
         )
+        self.rag_system.response_cache = MockResponseCache()
         
         # Use real tool manager with mock vector store
         from search_tools import ToolManager, CourseSearchTool, CourseOutlineTool
@@ -418,7 +556,7 @@ class TestRAGSystemIntegration:
         # Configure AI to use tools
         self.rag_system.ai_generator.should_use_tools = True
         
-        response, sources = self.rag_system.query("What is Python?")
+        response, sources = asyncio.run(self.rag_system.query("What is Python?"))
         
         assert "Based on search results:" in response
         # Should have real tool definitions
@@ -437,21 +575,53 @@ class TestRAGSystemIntegration:
         self.rag_system.search_tool.store.search = failing_search
         
         # Should not crash the whole system
-        response, sources = self.rag_system.query("test query")
+        response, sources = asyncio.run(self.rag_system.query("test query"))
         
         # Response should still be generated (either error message or fallback)
         assert response is not None
         assert len(response) > 0
     
+    def test_concurrent_queries_keep_their_own_sources(self):
+        """Test that interleaved queries never read or clear each other's sources"""
+        class InterleavingAIGenerator:
+            async def generate_response(self, query, conversation_history=None,
+                                        tools=None, tool_manager=None):
+                user = query.rsplit(" ", 1)[-1]
+                await tool_manager.execute_tool_async("echo", query=f"source for {user}")
+                # Let the other request run its tool before this one finishes
+                await asyncio.sleep(0.01)
+                return f"answer for {user}"
+        
+        from .test_search_tools import EchoSourceTool
+        self.rag_system.tool_manager.register_tool(EchoSourceTool())
+        self.rag_system.ai_generator = InterleavingAIGenerator()
+        
+        async def run_queries():
+            return await asyncio.gather(
+                self.rag_system.query("question from A"),
+                self.rag_system.query("question from B"),
+            )
+        
+        (answer_a, sources_a), (answer_b, sources_b) = asyncio.run(run_queries())
+        
+        assert answer_a == "answer for A"
+        assert sources_a == [{"text": "source for A"}]
+        assert answer_b == "answer for B"
+        assert sources_b == [{"text": "source for B"}]
+        
+        # The cache stores each answer with its own citations
+        cache = self.rag_system.response_cache.entries
+        assert cache[("question from A", None)] == ("answer for A", [{"text": "source for A"}])
+    
     def test_conversation_context_handling(self):
         """Test conversation context across multiple queries"""
         session_id = "test_conversation"
         
         # First query
-        response1, _ = self.rag_system.query("What is machine learning?", session_id)
+        response1, _ = asyncio.run(self.rag_system.query("What is machine learning?", session_id))
         
         # Second query with context
-        response2, _ = self.rag_system.query("How does it work?", session_id)
+        response2, _ = asyncio.run(self.rag_system.query("How does it work?", session_id))
         
         # Should have maintained session context
         history = self.rag_system.session_manager.get_conversation_history(session_id)
@@ -463,7 +633,7 @@ class TestRAGSystemIntegration:
         """Test system behavior with empty knowledge base"""
         # Don't add any courses
         
-        response, sources = self.rag_system.query("What courses are available?")
+        response, sources = asyncio.run(self.rag_system.query("What courses are available?"))
         
         # Should handle gracefully
         assert response is not None
@@ -0,0 +1,139 @@
+"""
+Tests for response_cache.py - SemanticResponseCache lookup and storage.
+
+These tests verify that cached answers are only reused for similar queries
+in the same conversation context.
+"""
+
+import pytest
+from unittest.mock import Mock
+import json
+import time
+
+# Import the classes we're testing
+from response_cache import SemanticResponseCache
+
+
+class TestSemanticResponseCache:
+    """Test cases for SemanticResponseCache"""
+
+    def setup_method(self):
+        """Setup for each test method"""
+        self.mock_collection = Mock()
+        self.mock_vector_store = Mock()
+        self.mock_vector_store.client.get_or_create_collection.return_value = self.mock_collection
+
+        self.cache = SemanticResponseCache(self.mock_vector_store, similarity_threshold=0.95, ttl_seconds=60)
+
+    def _query_result(self, distance, expires_at=None):
+        """Build a ChromaDB-style query result for a single cached entry"""
+        if expires_at is None:
+            expires_at = time.time() + 60
+        return {
+            'documents': [["What is Python?"]],
+            'metadatas': [[{
+                "history_hash": "hash",
+                "answer": "Cached answer",
+                "sources_json": json.dumps([{"text": "Python docs"}]),
+                "expires_at": expires_at
+            }]],
+            'distances': [[distance]]
+        }
+
+    def test_collection_uses_cosine_space(self):
+        """Test that the cache collection is created with cosine distance"""
+        kwargs = self.mock_vector_store.client.get_or_create_collection.call_args.kwargs
+
+        assert kwargs["name"] == "response_cache"
+        assert kwargs["embedding_function"] == self.mock_vector_store.embedding_function
+        assert kwargs["metadata"] == {"hnsw:space": "cosine"}
+
+    def test_lookup_hit(self):
+        """Test lookup returns cached answer above the similarity threshold"""
+        self.mock_collection.query.return_value = self._query_result(distance=0.02)
+
+        result = self.cache.lookup("What's Python?")
+
+        assert result == ("Cached answer", [{"text": "Python docs"}])
+
+    def test_lookup_with_precomputed_embedding(self):
+        """Test lookup queries by embedding instead of re-embedding the text"""
+        self.mock_collection.query.return_value = self._query_result(distance=0.02)
+        
+        self.cache.lookup("What's Python?", query_embedding=[0.1, 0.2])
+        
+        kwargs = self.mock_collection.query.call_args.kwargs
+        assert kwargs["query_embeddings"] == [[0.1, 0.2]]
+        assert "query_texts" not in kwargs
+    
+    def test_embed_query(self):
+        """Test that queries are embedded with the store's embedding function"""
+        self.mock_vector_store.embedding_function.return_value = [[0.1, 0.2]]
+        
+        assert self.cache.embed_query("What is Python?") == [0.1, 0.2]
+        self.mock_vector_store.embedding_function.assert_called_with(["What is Python?"])
+    
+    def test_lookup_below_threshold(self):
+        """Test lookup misses when the closest entry is not similar enough"""
+        self.mock_collection.query.return_value = self._query_result(distance=0.2)
+
+        assert self.cache.lookup("Something else") is None
+
+    def test_lookup_expired_entry(self):
+        """Test lookup ignores tool-backed entries past their TTL"""
+        self.mock_collection.query.return_value = self._query_result(
+            distance=0.0, expires_at=time.time() - 1
+        )
+
+        assert self.cache.lookup("What is Python?") is None
+
+    def test_lookup_entry_without_expiry_is_stale(self):
+        """Test that entries stored without an expiry are not served forever"""
+        self.mock_collection.query.return_value = self._query_result(distance=0.0, expires_at=0)
+
+        assert self.cache.lookup("What is Python?") is None
+
+    def test_lookup_filters_by_history(self):
+        """Test lookup only considers entries from the same conversation context"""
+        self.mock_collection.query.return_value = {'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
+
+        assert self.cache.lookup("What is Python?", "User: hi") is None
+
+        where = self.mock_collection.query.call_args.kwargs["where"]
+        assert where == {"history_hash": SemanticResponseCache._history_hash("User: hi")}
+        assert where != {"history_hash": SemanticResponseCache._history_hash(None)}
+
+    def test_lookup_error_returns_none(self):
+        """Test lookup treats database errors as a cache miss"""
+        self.mock_collection.query.side_effect = Exception("Database error")
+
+        assert self.cache.lookup("What is Python?") is None
+
+    def test_store_sets_ttl_for_every_answer(self):
+        """Test that answers expire whether or not they have sources"""
+        self.cache.store("General question", None, "No relevant content found.", [])
+        general_meta = self.mock_collection.upsert.call_args.kwargs["metadatas"][0]
+        assert general_meta["expires_at"] > time.time()
+
+        self.cache.store("Course question", None, "Course answer", [{"text": "Lesson 1"}])
+        course_meta = self.mock_collection.upsert.call_args.kwargs["metadatas"][0]
+        assert course_meta["expires_at"] > time.time()
+        assert json.loads(course_meta["sources_json"]) == [{"text": "Lesson 1"}]
+    
+    def test_store_reuses_precomputed_embedding(self):
+        """Test that store passes the lookup embedding instead of re-embedding"""
+        self.cache.store("Question", None, "Answer", [], query_embedding=[0.1, 0.2])
+        
+        assert self.mock_collection.upsert.call_args.kwargs["embeddings"] == [[0.1, 0.2]]
+
+    def test_clear_recreates_collection(self):
+        """Test clearing drops and recreates the cache collection"""
+        self.cache.clear()
+
+        self.mock_vector_store.client.delete_collection.assert_called_with("response_cache")
+        assert self.mock_vector_store.client.get_or_create_collection.call_count == 2
+
+
+if __name__ == "__main__":
+    # Run the tests
+    pytest.main([__file__, "-v"])
@@ -5,17 +5,15 @@ These tests help diagnose potential issues in the search tool execution that cou
 cause NetworkError in the RAG chatbot.
 """
 
+import asyncio
 import pytest
 from unittest.mock import Mock, MagicMock, patch
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import json
+import time
 
 # Import the classes we're testing
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from search_tools import CourseSearchTool, CourseOutlineTool, ToolManager
+from search_tools import Tool, CourseSearchTool, CourseOutlineTool, ToolManager
 from vector_store import SearchResults
 
 
@@ -28,6 +26,7 @@ class MockVectorStore:
         self.course_resolution_fails = False
         self.course_data = {}
         self.search_results = []
+        self.lesson_link_calls = []
         
     def search(self, query: str, course_name: Optional[str] = None, 
                lesson_number: Optional[int] = None) -> SearchResults:
@@ -55,9 +54,13 @@ class MockVectorStore:
             return None
         return "Resolved Course Title"
     
-    def get_lesson_link(self, course_title: str, lesson_number: int) -> Optional[str]:
-        """Mock lesson link retrieval"""
-        return f"https://example.com/{course_title}/lesson/{lesson_number}"
+    def get_lesson_links(self, course_titles: List[str]) -> Dict[Tuple[str, int], str]:
+        """Mock batched lesson link retrieval"""
+        self.lesson_link_calls.append(course_titles)
+        return {
+            (title, number): f"https://example.com/{title}/lesson/{number}"
+            for title in course_titles for number in range(10)
+        }
         
     @property 
     def course_catalog(self):
@@ -85,6 +88,9 @@ class TestCourseSearchTool:
         assert "input_schema" in definition
         assert "query" in definition["input_schema"]["properties"]
         assert ["query"] == definition["input_schema"]["required"]
+        
+        # Definitions are module constants shared across calls and instances
+        assert definition is CourseSearchTool(self.mock_vector_store).get_tool_definition()
     
     def test_execute_successful_search(self):
         """Test successful search with results"""
@@ -171,6 +177,29 @@ class TestCourseSearchTool:
         source = self.search_tool.last_sources[0]
         assert source["text"] == "Python Basics - Lesson 3"
         assert "link" in source
+    
+    def test_format_results_batches_lesson_links(self):
+        """Test that lesson links for all results are fetched in one call"""
+        results = SearchResults(
+            documents=["Doc 1", "Doc 2", "Doc 3"],
+            metadata=[
+                {'course_title': 'Course A', 'lesson_number': 1},
+                {'course_title': 'Course A', 'lesson_number': 2},
+                {'course_title': 'Course B', 'lesson_number': 1}
+            ],
+            distances=[0.1, 0.2, 0.3]
+        )
+        
+        self.search_tool._format_results(results)
+        
+        assert len(self.mock_vector_store.lesson_link_calls) == 1
+        assert sorted(self.mock_vector_store.lesson_link_calls[0]) == ['Course A', 'Course B']
+        links = [source["link"] for source in self.search_tool.last_sources]
+        assert links == [
+            "https://example.com/Course A/lesson/1",
+            "https://example.com/Course A/lesson/2",
+            "https://example.com/Course B/lesson/1"
+        ]
 
 
 class TestCourseOutlineTool:
@@ -270,6 +299,19 @@ class TestToolManager:
         assert len(definitions) == 1
         assert definitions[0]["name"] == "search_course_content"
     
+    def test_tool_definitions_cached_until_registration(self):
+        """Test that tool definitions are built once and refreshed on registration"""
+        self.tool_manager.register_tool(CourseSearchTool(self.mock_vector_store))
+        
+        first = self.tool_manager.get_tool_definitions()
+        assert self.tool_manager.get_tool_definitions() is first
+        
+        self.tool_manager.register_tool(CourseOutlineTool(self.mock_vector_store))
+        
+        definitions = self.tool_manager.get_tool_definitions()
+        assert definitions is not first
+        assert len(definitions) == 2
+    
     def test_execute_tool(self):
         """Test tool execution through manager"""
         search_tool = CourseSearchTool(self.mock_vector_store)
@@ -281,6 +323,17 @@ class TestToolManager:
         
         assert "Test result" in result
     
+    def test_execute_tool_async(self):
+        """Test async tool execution through manager"""
+        search_tool = CourseSearchTool(self.mock_vector_store)
+        self.tool_manager.register_tool(search_tool)
+        
+        self.mock_vector_store.search_results = ["Async result"]
+        
+        result = asyncio.run(self.tool_manager.execute_tool_async("search_course_content", query="test"))
+        
+        assert "Async result" in result
+    
     def test_execute_nonexistent_tool(self):
         """Test execution of tool that doesn't exist"""
         result = self.tool_manager.execute_tool("nonexistent_tool", query="test")
@@ -315,6 +368,41 @@ class TestToolManager:
         # Reset sources and verify they're cleared
         self.tool_manager.reset_sources()
         assert len(self.tool_manager.get_last_sources()) == 0
+    
+    def test_request_views_keep_their_own_sources(self):
+        """Test concurrent calls report sources only to their own request, in call order"""
+        self.tool_manager.register_tool(EchoSourceTool())
+        
+        async def run_requests():
+            first = self.tool_manager.for_request()
+            second = self.tool_manager.for_request()
+            await asyncio.gather(
+                first.execute_tool_async("echo", query="first-1", delay=0.05),
+                second.execute_tool_async("echo", query="second-1"),
+                first.execute_tool_async("echo", query="first-2"),
+            )
+            return first.get_sources(), second.get_sources()
+        
+        first_sources, second_sources = asyncio.run(run_requests())
+        
+        # The slow first call finishes last but keeps its place
+        assert first_sources == [{"text": "first-1"}, {"text": "first-2"}]
+        assert second_sources == [{"text": "second-1"}]
+
+
+class EchoSourceTool(Tool):
+    """Tool that records its query as its only source, optionally after a delay"""
+    
+    def __init__(self):
+        self.last_sources = []
+    
+    def get_tool_definition(self) -> Dict[str, Any]:
+        return {"name": "echo", "description": "Echo the query", "input_schema": {"type": "object"}}
+    
+    def execute(self, query: str, delay: float = 0) -> str:
+        time.sleep(delay)
+        self._record_sources([{"text": query}])
+        return query
 
 
 class TestIntegration:
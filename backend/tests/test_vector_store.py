@@ -8,15 +8,12 @@ cause NetworkError in the RAG chatbot.
 import pytest
 import tempfile
 import shutil
+import json
 import os
 from unittest.mock import Mock, MagicMock, patch
 from typing import List, Dict, Any
 
 # Import the classes we're testing
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from vector_store import VectorStore, SearchResults
 from models import Course, Lesson, CourseChunk
 
@@ -207,6 +204,28 @@ class TestVectorStore:
         assert "Found content about Python" in results.documents[0]
         assert results.metadata[0]["course_title"] == "Python Course"
     
+    @patch('vector_store.chromadb.PersistentClient')
+    @patch('vector_store.chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
+    def test_search_with_precomputed_embedding(self, mock_embedding_func, mock_client_class):
+        """Test search passes a precomputed embedding instead of query text"""
+        mock_client_class.return_value = self.mock_client
+        
+        self.mock_collection.query.return_value = {
+            'documents': [["Found content about Python"]],
+            'metadatas': [[{"course_title": "Python Course", "lesson_number": 1}]],
+            'distances': [[0.1]]
+        }
+        
+        vector_store = VectorStore(self.test_chroma_path, "test-model")
+        vector_store.course_content = self.mock_collection
+        
+        results = vector_store.search("Python programming", query_embedding=[0.1, 0.2, 0.3])
+        
+        assert not results.is_empty()
+        call_kwargs = self.mock_collection.query.call_args[1]
+        assert call_kwargs['query_embeddings'] == [[0.1, 0.2, 0.3]]
+        assert 'query_texts' not in call_kwargs
+    
     @patch('vector_store.chromadb.PersistentClient')
     @patch('vector_store.chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
     def test_search_with_course_filter(self, mock_embedding_func, mock_client_class):
@@ -295,6 +314,48 @@ class TestVectorStore:
         # Verify catalog was queried correctly
         mock_catalog.query.assert_called_with(query_texts=["Python"], n_results=1)
     
+    @patch('vector_store.chromadb.PersistentClient')
+    @patch('vector_store.chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
+    def test_resolve_course_name_cached(self, mock_embedding_func, mock_client_class):
+        """Test repeated course name resolution hits the catalog once until it changes"""
+        mock_client_class.return_value = self.mock_client
+        
+        mock_catalog = Mock()
+        mock_catalog.query.return_value = {
+            'documents': [["Python Programming"]],
+            'metadatas': [[{"title": "Python Programming Course"}]]
+        }
+        
+        vector_store = VectorStore(self.test_chroma_path, "test-model")
+        vector_store.course_catalog = mock_catalog
+        
+        assert vector_store._resolve_course_name("Python") == "Python Programming Course"
+        assert vector_store._resolve_course_name("Python") == "Python Programming Course"
+        assert mock_catalog.query.call_count == 1
+        
+        # Adding a course invalidates cached lookups
+        vector_store.add_course_metadata(Course(title="New Course"))
+        vector_store._resolve_course_name("Python")
+        assert mock_catalog.query.call_count == 2
+    
+    @patch('vector_store.chromadb.PersistentClient')
+    @patch('vector_store.chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
+    def test_resolve_course_name_error_not_cached(self, mock_embedding_func, mock_client_class):
+        """Test catalog errors are retried rather than cached"""
+        mock_client_class.return_value = self.mock_client
+        
+        mock_catalog = Mock()
+        mock_catalog.query.side_effect = [
+            Exception("Database error"),
+            {'documents': [["Python"]], 'metadatas': [[{"title": "Python Course"}]]}
+        ]
+        
+        vector_store = VectorStore(self.test_chroma_path, "test-model")
+        vector_store.course_catalog = mock_catalog
+        
+        assert vector_store._resolve_course_name("Python") is None
+        assert vector_store._resolve_course_name("Python") == "Python Course"
+    
     @patch('vector_store.chromadb.PersistentClient')
     @patch('vector_store.chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
     def test_build_filter_combinations(self, mock_embedding_func, mock_client_class):
@@ -358,6 +419,75 @@ class TestVectorStore:
         count = vector_store.get_course_count()
         assert count == 2
     
+    @patch('vector_store.chromadb.PersistentClient')
+    @patch('vector_store.chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
+    def test_get_lesson_links(self, mock_embedding_func, mock_client_class):
+        """Test fetching lesson links for several courses in one catalog read"""
+        mock_client_class.return_value = self.mock_client
+        
+        mock_catalog = Mock()
+        mock_catalog.get.return_value = {
+            'metadatas': [
+                {'title': 'Course 1', 'lessons_json': json.dumps([
+                    {'lesson_number': 1, 'lesson_link': 'https://example.com/c1/l1'},
+                    {'lesson_number': 2, 'lesson_link': None}
+                ])},
+                {'title': 'Course 2', 'lessons_json': json.dumps([
+                    {'lesson_number': 1, 'lesson_link': 'https://example.com/c2/l1'}
+                ])}
+            ]
+        }
+        
+        vector_store = VectorStore(self.test_chroma_path, "test-model")
+        vector_store.course_catalog = mock_catalog
+        
+        links = vector_store.get_lesson_links(['Course 1', 'Course 2'])
+        
+        mock_catalog.get.assert_called_once_with(ids=['Course 1', 'Course 2'])
+        assert links == {
+            ('Course 1', 1): 'https://example.com/c1/l1',
+            ('Course 2', 1): 'https://example.com/c2/l1'
+        }
+    
+    @patch('vector_store.chromadb.PersistentClient')
+    @patch('vector_store.chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
+    def test_get_lesson_links_cached(self, mock_embedding_func, mock_client_class):
+        """Test lesson links are read once per course until the catalog changes"""
+        mock_client_class.return_value = self.mock_client
+        
+        mock_catalog = Mock()
+        mock_catalog.get.return_value = {
+            'metadatas': [
+                {'title': 'Course 1', 'lessons_json': json.dumps([
+                    {'lesson_number': 1, 'lesson_link': 'https://example.com/c1/l1'}
+                ])}
+            ]
+        }
+        
+        vector_store = VectorStore(self.test_chroma_path, "test-model")
+        vector_store.course_catalog = mock_catalog
+        
+        assert vector_store.get_lesson_links(['Course 1']) == {('Course 1', 1): 'https://example.com/c1/l1'}
+        assert vector_store.get_lesson_link('Course 1', 1) == 'https://example.com/c1/l1'
+        assert mock_catalog.get.call_count == 1
+        
+        # Only the uncached course is read
+        vector_store.get_lesson_links(['Course 1', 'Course 2'])
+        mock_catalog.get.assert_called_with(ids=['Course 2'])
+        assert mock_catalog.get.call_count == 2
+        
+        # Adding a course invalidates the cached lesson maps
+        mock_catalog.get.return_value = {
+            'metadatas': [
+                {'title': 'Course 1', 'lessons_json': json.dumps([
+                    {'lesson_number': 1, 'lesson_link': 'https://example.com/c1/l1-new'}
+                ])}
+            ]
+        }
+        vector_store.add_course_metadata(Course(title="New Course"))
+        assert vector_store.get_lesson_link('Course 1', 1) == 'https://example.com/c1/l1-new'
+        assert mock_catalog.get.call_count == 3
+    
     @patch('vector_store.chromadb.PersistentClient')
     @patch('vector_store.chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
     def test_clear_all_data(self, mock_embedding_func, mock_client_class):
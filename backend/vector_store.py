@@ -1,6 +1,7 @@
 import chromadb
+from functools import lru_cache
 from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
 from models import Course, CourseChunk
 from sentence_transformers import SentenceTransformer
@@ -50,6 +51,15 @@ class VectorStore:
         # Create collections for different types of data
         self.course_catalog = self._create_collection("course_catalog")  # Course titles/instructors
         self.course_content = self._create_collection("course_content")  # Actual course material
+        
+        # Per-instance caches for repeated catalog lookups; cleared whenever the catalog changes
+        self._course_name_cache = lru_cache(maxsize=2048)(self._query_course_name)
+        self._lesson_links_cache: Dict[str, Dict[int, str]] = {}  # Lesson number -> link per course title
+    
+    def _invalidate_caches(self):
+        """Drop cached catalog lookups after the catalog is modified"""
+        self._course_name_cache.cache_clear()
+        self._lesson_links_cache.clear()
     
     def _create_collection(self, name: str):
         """Create or get a ChromaDB collection"""
@@ -62,7 +72,8 @@ class VectorStore:
                query: str,
                course_name: Optional[str] = None,
                lesson_number: Optional[int] = None,
-               limit: Optional[int] = None) -> SearchResults:
+               limit: Optional[int] = None,
+               query_embedding: Optional[List[float]] = None) -> SearchResults:
         """
         Main search interface that handles course resolution and content search.
         
@@ -71,6 +82,7 @@ class VectorStore:
             course_name: Optional course name/title to filter by
             lesson_number: Optional lesson number to filter by
             limit: Maximum results to return
+            query_embedding: Precomputed embedding of the query, if available
             
         Returns:
             SearchResults object with documents and metadata
@@ -89,9 +101,15 @@ class VectorStore:
         # Use provided limit or fall back to configured max_results
         search_limit = limit if limit is not None else self.max_results
         
+        # Skip the embedding model when the caller already has the vector
+        if query_embedding is not None:
+            query_input = {"query_embeddings": [query_embedding]}
+        else:
+            query_input = {"query_texts": [query]}
+        
         try:
             results = self.course_content.query(
-                query_texts=[query],
+                **query_input,
                 n_results=search_limit,
                 where=filter_dict
             )
@@ -102,19 +120,24 @@ class VectorStore:
     def _resolve_course_name(self, course_name: str) -> Optional[str]:
         """Use vector search to find best matching course by name"""
         try:
-            results = self.course_catalog.query(
-                query_texts=[course_name],
-                n_results=1
-            )
-            
-            if results['documents'][0] and results['metadatas'][0]:
-                # Return the title (which is now the ID)
-                return results['metadatas'][0][0]['title']
+            return self._course_name_cache(course_name)
         except Exception as e:
             print(f"Error resolving course name: {e}")
         
         return None
     
+    def _query_course_name(self, course_name: str) -> Optional[str]:
+        """Query the catalog for a course title (errors propagate so they are not cached)"""
+        results = self.course_catalog.query(
+            query_texts=[course_name],
+            n_results=1
+        )
+        
+        if results['documents'][0] and results['metadatas'][0]:
+            # Return the title (which is now the ID)
+            return results['metadatas'][0][0]['title']
+        return None
+    
     def _build_filter(self, course_title: Optional[str], lesson_number: Optional[int]) -> Optional[Dict]:
         """Build ChromaDB filter from search parameters"""
         if not course_title and lesson_number is None:
@@ -158,6 +181,7 @@ class VectorStore:
             }],
             ids=[course.title]
         )
+        self._invalidate_caches()
     
     def add_course_content(self, chunks: List[CourseChunk]):
         """Add course content chunks to the vector store"""
@@ -189,6 +213,7 @@ class VectorStore:
             self.course_content = self._create_collection("course_content")
         except Exception as e:
             print(f"Error clearing data: {e}")
+        self._invalidate_caches()
     
     def get_existing_course_titles(self) -> List[str]:
         """Get all existing course titles from the vector store"""
@@ -246,22 +271,39 @@ class VectorStore:
             print(f"Error getting course link: {e}")
             return None
     
+    def get_lesson_links(self, course_titles: List[str]) -> Dict[Tuple[str, int], str]:
+        """Get lesson links for several courses at once, keyed by (course title, lesson number)"""
+        # Only courses not already cached are read, in a single catalog call
+        missing = [title for title in course_titles if title not in self._lesson_links_cache]
+        if missing:
+            try:
+                self._lesson_links_cache.update(self._query_lesson_links(missing))
+            except Exception as e:
+                print(f"Error getting lesson links: {e}")
+        
+        links = {}
+        for title in course_titles:
+            for lesson_number, link in self._lesson_links_cache.get(title, {}).items():
+                links[(title, lesson_number)] = link
+        return links
+    
+    def _query_lesson_links(self, course_titles: List[str]) -> Dict[str, Dict[int, str]]:
+        """Read per-course lesson link maps from the catalog (errors propagate so they are not cached)"""
+        import json
+        # Courses missing from the catalog get an empty map until the catalog changes
+        lesson_maps = {title: {} for title in course_titles}
+        results = self.course_catalog.get(ids=course_titles)
+        for metadata in results.get('metadatas') or []:
+            lessons_json = metadata.get('lessons_json')
+            if not lessons_json:
+                continue
+            lesson_maps[metadata.get('title')] = {
+                lesson.get('lesson_number'): lesson['lesson_link']
+                for lesson in json.loads(lessons_json)
+                if lesson.get('lesson_link')
+            }
+        return lesson_maps
+    
     def get_lesson_link(self, course_title: str, lesson_number: int) -> Optional[str]:
         """Get lesson link for a given course title and lesson number"""
-        import json
-        try:
-            # Get course by ID (title is the ID)
-            results = self.course_catalog.get(ids=[course_title])
-            if results and 'metadatas' in results and results['metadatas']:
-                metadata = results['metadatas'][0]
-                lessons_json = metadata.get('lessons_json')
-                if lessons_json:
-                    lessons = json.loads(lessons_json)
-                    # Find the lesson with matching number
-                    for lesson in lessons:
-                        if lesson.get('lesson_number') == lesson_number:
-                            return lesson.get('lesson_link')
-            return None
-        except Exception as e:
-            print(f"Error getting lesson link: {e}")
-    
\ No newline at end of file
+        return self.get_lesson_links([course_title]).get((course_title, lesson_number))
@@ -108,10 +108,10 @@ async function sendMessage() {
   chatMessages.scrollTop = chatMessages.scrollHeight;
 
   try {
-    console.log('Making request to:', `${API_URL}/query`);
+    console.log('Making request to:', `${API_URL}/query/stream`);
     console.log('Request payload:', { query, session_id: currentSessionId });
 
-    const response = await fetch(`${API_URL}/query`, {
+    const response = await fetch(`${API_URL}/query/stream`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -131,17 +131,49 @@ async function sendMessage() {
       throw new Error(`API Error (${response.status}): ${errorText}`);
     }
 
-    const data = await response.json();
-    console.log('Response data:', data);
+    // Render the answer as server-sent events arrive
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const loadingContent = loadingMessage.querySelector('.message-content');
+    let buffer = '';
+    let answer = '';
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) {
+        break;
+      }
 
-    // Update session ID if new
-    if (!currentSessionId) {
-      currentSessionId = data.session_id;
-    }
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split('\n\n');
+      buffer = events.pop();
 
-    // Replace loading message with response
-    loadingMessage.remove();
-    addMessage(data.answer, 'assistant', data.sources);
+      for (const event of events) {
+        if (!event.startsWith('data: ')) {
+          continue;
+        }
+        const data = JSON.parse(event.slice('data: '.length));
+
+        if (data.type === 'chunk') {
+          answer += data.text;
+          loadingContent.innerHTML = marked.parse(answer);
+          chatMessages.scrollTop = chatMessages.scrollHeight;
+        } else if (data.type === 'done') {
+          console.log('Response sources:', data.sources);
+
+          // Update session ID if new
+          if (!currentSessionId) {
+            currentSessionId = data.session_id;
+          }
+
+          // Replace streamed message with the final response and sources
+          loadingMessage.remove();
+          addMessage(answer, 'assistant', data.sources);
+        } else if (data.type === 'error') {
+          throw new Error(`API Error (stream): ${data.detail}`);
+        }
+      }
+    }
   } catch (error) {
     console.error('Request failed:', error);
 